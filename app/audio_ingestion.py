@@ -1,10 +1,13 @@
 import os
 import json
 import re
-import requests
-import msal
 import asyncio
-import dateutil.parser
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from importlib.metadata import version
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -12,15 +15,17 @@ from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 
 # --- Indexing imports ---
 from supabase import create_client, Client
-from docling.document_converter import AudioFormatOption, DocumentConverter
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel import asr_model_specs
-from docling.datamodel.pipeline_options import AsrPipelineOptions
-from docling.pipeline.asr_pipeline import AsrPipeline
 import openai
 import google.generativeai as genai
 
 from langchain_core.documents import Document
+import transcription
+from bulk_writer import BulkWriter
+from chunk_gc import collect_orphans
+from disk_cache import DiskCache
+from index_manifest import file_sha256
+from sharepoint_sync import DriveSync
+from sync_lock import SyncLock
 from config import (
     global_supabase_client,
     global_embedding_service_instance,
@@ -30,32 +35,41 @@ from config import (
     LLM_SERVICE,
     LLM_API_KEY,
     SUPABASE_AUDIO_TABLE,
+    SUPABASE_DB_URL,
+    BULK_WRITE_MAX_BYTES,
+    BULK_WRITE_CONCURRENCY,
+    BULK_WRITE_MAX_RETRIES,
+    CHUNK_GC_ENABLED,
+    AUDIO_ASR_WORKERS,
+    AUDIO_ASR_THREADS,
+    AUDIO_VAD_ENABLED,
+    AUDIO_VAD_TOP_DB,
+    AUDIO_VAD_MIN_SILENCE_SECONDS,
+    AUDIO_WINDOW_SECONDS,
+    AUDIO_WINDOW_OVERLAP_SECONDS,
+    TRANSCRIPT_CACHE_DIR,
+    TRANSCRIPT_CACHE_MAX_MB,
+    AUDIO_CALLS_IN_PROGRESS,
+    AUDIO_LLM_CONCURRENCY,
+    AUDIO_EMBED_CONCURRENCY,
+    AUDIO_WRITE_CONCURRENCY,
 )
 
 load_dotenv()
 
 
 # --- Part 1: SharePoint Sync ---
-class SharePointSync:
-    def __init__(self, download_dir):
-
-        self.tenant_id = os.getenv("OFFICE_365_TENANT_ID")
-        self.client_id = os.getenv("OFFICE_365_CLIENT_ID")
-        self.client_secret = os.getenv("OFFICE_365_CLIENT_SECRET")
-        self.host_name = os.getenv("OFFICE_365_SITE_HOSTNAME")
-        self.site_path = os.getenv("OFFICE_365_CONVERSATION_SITE_NAME")
-        self.doc_lib_name = os.getenv("OFFICE_365_CONVERSATION_DOCUMENT_LIBRARY_NAME")
-
-        self.download_dir = download_dir
-        self.state_file = Path("audio_sync_state.json")
-        self.sync_state = {}
-        self.updated_files = []
-        self.headers = None
-        self.scopes = ["https://graph.microsoft.com/.default"]
-
-        if self.state_file.exists():
-            with open(self.state_file, "r") as f:
-                self.sync_state = json.load(f)
+class SharePointSync(DriveSync):
+    site_env = "OFFICE_365_CONVERSATION_SITE_NAME"
+    library_env = "OFFICE_365_CONVERSATION_DOCUMENT_LIBRARY_NAME"
+
+    def __init__(self, download_dir, mode=None):
+        super().__init__(
+            download_dir,
+            "audio_sync_state.sqlite3",
+            mode,
+            legacy_state=("audio_sync_state.json", "audio_sync_delta.json"),
+        )
 
         # REGEX: [Name]_Ext-Phone_Timestamp.wav (Phone must be 7-15 digits to filter out extension-to-extension)
         # REGEX EXPLANATION:
@@ -71,119 +85,71 @@ class SharePointSync:
             r"^(\[.*?\])?_(\d{3,4})-(\d{7,15})_(\d+).*?\.wav$", re.IGNORECASE
         )
 
-    def authenticate(self):
-        app = msal.ConfidentialClientApplication(
-            self.client_id,
-            authority=f"https://login.microsoftonline.com/{self.tenant_id}",
-            client_credential=self.client_secret,
-        )
-        result = app.acquire_token_for_client(scopes=self.scopes)
-        if "access_token" in result:
-            self.headers = {"Authorization": f'Bearer {result["access_token"]}'}
-        else:
-            raise Exception(f"Auth failed: {result.get('error_description')}")
-
-    def get_site_and_drive(self):
-        site_url = f"https://graph.microsoft.com/v1.0/sites/{self.host_name}"
-        resp = requests.get(site_url, headers=self.headers)
-        resp.raise_for_status()
-        site_id = resp.json()["id"]
-
-        resp = requests.get(
-            f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives",
-            headers=self.headers,
-        )
-
-        drive_id = next(
-            (d["id"] for d in resp.json()["value"] if d["name"] == self.doc_lib_name),
-            None,
-        )
-        if not drive_id:
-            raise Exception("Drive not found")
-        return site_id, drive_id
+    def site_ref(self):
+        return self.host_name
 
     def is_valid_audio_file(self, filename):
         return bool(self.audio_pattern.match(filename))
 
-    def process_folder(self, site_id, drive_id, folder_id="root", current_path=None):
-        if current_path is None:
-            current_path = self.download_dir
-
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{folder_id}/children"
-
-        while url:
-            resp = requests.get(url, headers=self.headers)
-            data = resp.json()
-
-            for item in data.get("value", []):
-                name = item["name"]
-                local_path = current_path / name
-
-                if "folder" in item:
-                    self.process_folder(site_id, drive_id, item["id"], local_path)
-                elif "file" in item:
-                    if not self.is_valid_audio_file(name):
-                        continue
-
-                    remote_mod = item["lastModifiedDateTime"]
-                    item_id = item["id"]
-
-                    needs_sync = True
-                    if item_id in self.sync_state:
-                        saved_time = dateutil.parser.isoparse(self.sync_state[item_id])
-                        remote_time = dateutil.parser.isoparse(remote_mod)
-                        if remote_time <= saved_time and local_path.exists():
-                            needs_sync = False
-
-                    if needs_sync:
-                        self.download_file(
-                            item["@microsoft.graph.downloadUrl"], local_path
-                        )
-                        self.sync_state[item_id] = remote_mod
-                        self.updated_files.append(local_path)
-
-            url = data.get("@odata.nextLink")
-
-    def download_file(self, url, path):
-        path.parent.mkdir(parents=True, exist_ok=True)
-        print(f"Downloading: {path}")
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(path, "wb") as f:
-                for chunk in r.iter_content(8192):
-                    f.write(chunk)
-
-    def run(self):
-        self.authenticate()
-        site_id, drive_id = self.get_site_and_drive()
-        print("Starting SharePoint Sync for Audio Files...")
-        self.process_folder(site_id, drive_id)
-
-        with open(self.state_file, "w") as f:
-            json.dump(self.sync_state, f, indent=4)
-
-        return self.updated_files
+    def should_sync(self, name):
+        return self.is_valid_audio_file(name)
 
 
 # --- Part 2: Audio Indexer ---
 class KnowledgeBaseIndexer:
-    def __init__(self, root_dir):
-        # Configure ASR pipeline
-        pipeline_options = AsrPipelineOptions(
-            asr_options=asr_model_specs.WHISPER_TURBO, language="es"
-        )
-        format_options = {
-            InputFormat.AUDIO: AudioFormatOption(
-                pipeline_cls=AsrPipeline,
-                pipeline_options=pipeline_options,
-            )
-        }
+    def __init__(self, root_dir, asr_workers=AUDIO_ASR_WORKERS, asr_threads=AUDIO_ASR_THREADS):
         self.root_dir = root_dir
         self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
         self.embedder = global_embedding_service_instance
-        self.converter = DocumentConverter(format_options=format_options)
+        # Whisper Turbo through Docling's ASR pipeline (used in-process when
+        # there is a single ASR worker).
+        self.converter = transcription.build_converter()
+        self.converter_lock = threading.Lock()
+
+        # More than one worker transcribes calls in a process pool, each
+        # with its own copy of the model and `asr_threads` torch threads
+        # (0 splits the cores evenly).
+        self.asr_workers = asr_workers
+        self.asr_threads = asr_threads or max(1, (os.cpu_count() or 1) // asr_workers)
+        self.asr_pool = None
+
+        # Long calls are transcribed as overlapping windows, in parallel.
+        self.window_seconds = AUDIO_WINDOW_SECONDS
+        self.window_overlap = AUDIO_WINDOW_OVERLAP_SECONDS
+        self.window_slots = None
+        # Limits on LLM, embedding and write calls, set for each run.
+        self.llm_slots = self.embed_slots = self.write_slots = None
+
+        # Only the speech regions of a call are sent to Whisper.
+        self.vad_options = (
+            {"top_db": AUDIO_VAD_TOP_DB, "min_silence": AUDIO_VAD_MIN_SILENCE_SECONDS}
+            if AUDIO_VAD_ENABLED
+            else None
+        )
+
+        # Transcripts keyed by audio content hash and everything that shapes
+        # the ASR output, so re-analysis/re-embedding skips Whisper.
+        self.transcript_cache = (
+            DiskCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)
+            if TRANSCRIPT_CACHE_DIR
+            else None
+        )
+        self.asr_options = (
+            f"docling={version('docling')}|{transcription.ASR_MODEL}"
+            f"|language={transcription.ASR_LANGUAGE}|vad={self.vad_options}"
+            f"|window={self.window_seconds}/{self.window_overlap}"
+        )
         self.db_schema = SUPABASE_SCHEMA
         self.db_table = SUPABASE_AUDIO_TABLE
+        self.writer = BulkWriter(
+            self.supabase,
+            self.db_schema,
+            self.db_table,
+            max_batch_bytes=BULK_WRITE_MAX_BYTES,
+            concurrency=BULK_WRITE_CONCURRENCY,
+            max_retries=BULK_WRITE_MAX_RETRIES,
+            db_url=SUPABASE_DB_URL,
+        )
         self.audio_pattern = re.compile(
             r"^(\[(.*?)\])?_(\d{3,4})-(\d{7,15})_(\d+).*?\.wav$", re.IGNORECASE
         )
@@ -228,6 +194,24 @@ class KnowledgeBaseIndexer:
         secs = int(seconds % 60)
         return f"{mins:02d}:{secs:02d}"
 
+    def delete_file_rows(self, file_path):
+        (
+            self.supabase.schema(self.db_schema)
+            .table(self.db_table)
+            .delete()
+            .eq("metadata->>filepath", str(file_path))
+            .execute()
+        )
+
+    def time_range(self, start, end):
+        """Chunk position in the call, when the ASR reported timings."""
+        if start is None or end is None:
+            return {}
+        return {
+            "start_time": self.format_timestamp(start),
+            "end_time": self.format_timestamp(end),
+        }
+
     async def analyze_full_transcript(self, full_text):
         """Quickly analyzes the whole call to get sentiment/purpose/etc."""
         prompt = f"""Analiza la siguiente transcripción y devuelve un objeto JSON con:
@@ -248,74 +232,252 @@ class KnowledgeBaseIndexer:
         )
         return json.loads(response.choices[0].message.content)
 
+    def transcript_key(self, content_hash):
+        raw = f"{content_hash}|{self.asr_options}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_transcript(self, file_path):
+        """Cached segments of a call, transcribing it on a cache miss."""
+        if self.transcript_cache is None:
+            return await self.transcribe(file_path)
+
+        content_hash = await asyncio.to_thread(file_sha256, file_path)
+        key = self.transcript_key(content_hash)
+        cached = await asyncio.to_thread(self.transcript_cache.get, key)
+        if cached is not None:
+            return cached["segments"]
+
+        segments = await self.transcribe(file_path)
+        await asyncio.to_thread(
+            self.transcript_cache.put,
+            key,
+            {"filename": file_path.name, "segments": segments},
+        )
+        return segments
+
+    async def transcribe(self, file_path):
+        """Segments ({text, start, end}) of a call, off the event loop.
+
+        The call is cut into overlapping windows (see
+        transcription.split_windows) that are transcribed in parallel and
+        stitched back together. Windows are only read from disk when an ASR
+        worker is about to be free, so a long call never sits in memory.
+        """
+        windows = transcription.split_windows(
+            file_path, self.window_seconds, self.window_overlap
+        )
+        tasks = []
+        try:
+            while True:
+                if self.window_slots is not None:
+                    await self.window_slots.acquire()
+                window = await asyncio.to_thread(next, windows, None)
+                if window is None:
+                    if self.window_slots is not None:
+                        self.window_slots.release()
+                    break
+                task = asyncio.create_task(self.transcribe_window(*window))
+                task.add_done_callback(lambda _, window=window: self.window_done(*window))
+                tasks.append(task)
+            results = await asyncio.gather(*tasks)
+        finally:
+            windows.close()
+            for task in tasks:
+                task.cancel()
+        if len(results) == 1:
+            return results[0][1]
+        return transcription.stitch_windows(results, self.window_overlap)
+
+    async def transcribe_window(self, offset, path, temporary):
+        if self.asr_pool is not None:
+            loop = asyncio.get_running_loop()
+            segments = await loop.run_in_executor(self.asr_pool, transcription.transcribe, path)
+        else:
+            segments = await asyncio.to_thread(self.transcribe_local, path)
+        return offset, transcription.shift_segments(segments, offset)
+
+    def window_done(self, offset, path, temporary):
+        # Also runs for windows cancelled before they started.
+        if temporary:
+            path.unlink(missing_ok=True)
+        if self.window_slots is not None:
+            self.window_slots.release()
+
+    def transcribe_local(self, file_path):
+        # One call at a time through the in-process model.
+        with self.converter_lock:
+            return transcription.transcribe_with(self.converter, file_path, self.vad_options)
+
+    async def embed_texts(self, texts):
+        # get_embeddings blocks on network round-trips, so it runs off the
+        # event loop, under the limit shared by every call.
+        async with self.embed_slots or nullcontext():
+            return await asyncio.to_thread(self.embedder.get_embeddings, texts)
+
+    async def analyze_call(self, full_text):
+        async with self.llm_slots or nullcontext():
+            return await self.analyze_full_transcript(full_text)
+
     async def index_file(self, file_path):
         print(f"Processing and Analyzing: {file_path.name}")
         try:
-            result = self.converter.convert(file_path)
+            segments = await self.get_transcript(file_path)
             # 1. Combine all text to get a full transcript for analysis
-            full_transcript = " ".join([item.text for item in result.document.texts])
-
-            # 2. Get the analysis metrics
-            analysis = await self.analyze_full_transcript(full_transcript)
+            full_transcript = " ".join(segment["text"] for segment in segments)
 
             file_meta = self.extract_metadata_from_name(file_path.name)
             category = self.get_category_from_path(file_path)
 
-            chunks_to_insert = []
+            # 2. Chunk the transcript; the analysis is only needed for the
+            # metadata, so chunks are embedded while it runs.
+            chunks = []
             combined_text = ""
+            chunk_start = None
 
-            for item in result.document.texts:
-                combined_text += item.text + " "
+            for segment in segments:
+                if not combined_text:
+                    chunk_start = segment["start"]
+                combined_text += segment["text"] + " "
                 if len(combined_text) >= 1200:
-                    vector = self.embedder.get_embedding(combined_text)
-                    if vector:
-                        chunks_to_insert.append(
-                            {
-                                "content": combined_text.strip(),
-                                "embedding": vector,
-                                "metadata": {
-                                    "filepath": str(file_path),
-                                    "filename": file_path.name,
-                                    "category": category,
-                                    **file_meta,
-                                    **analysis,  # <--- INJECT ANALYSIS INTO METADATA
-                                },
-                            }
-                        )
+                    chunks.append(
+                        (combined_text, self.time_range(chunk_start, segment["end"]))
+                    )
                     combined_text = ""
 
-            # 4. Handle remaining text
+            # Handle remaining text
             if combined_text.strip():
-                vector = self.embedder.get_embedding(combined_text)
-                if vector:
-                    chunks_to_insert.append(
-                        {
-                            "content": combined_text.strip(),
-                            "embedding": vector,
-                            "metadata": {"filepath": str(file_path), **file_meta},
-                        }
-                    )
+                chunks.append((combined_text, None))
 
-            if chunks_to_insert:
-                for i in range(0, len(chunks_to_insert), 10):
-                    self.supabase.schema(self.db_schema).table(self.db_table).insert(
-                        chunks_to_insert[i : i + 10]
-                    ).execute()
-                print(
-                    f"Finished {file_path.name}: Created {len(chunks_to_insert)} larger chunks."
-                )
+            # 3. Analysis and batched embedding of all chunks run concurrently
+            analysis, vectors = await asyncio.gather(
+                self.analyze_call(full_transcript),
+                self.embed_texts([text for text, _ in chunks]),
+            )
+
+            chunk_metadata = {
+                "filepath": str(file_path),
+                "filename": file_path.name,
+                "category": category,
+                **file_meta,
+                **analysis,  # <--- INJECT ANALYSIS INTO METADATA
+            }
+            tail_metadata = {"filepath": str(file_path), **file_meta}
+
+            chunks_to_insert = [
+                {
+                    "content": text.strip(),
+                    "embedding": vector,
+                    "metadata": (
+                        {**chunk_metadata, **time_range}
+                        if time_range is not None
+                        else tail_metadata
+                    ),
+                }
+                for (text, time_range), vector in zip(chunks, vectors)
+                if vector
+            ]
+
+            if chunks and not chunks_to_insert:
+                # Nothing embedded: keep the previous rows and retry next run.
+                print(f"Failed to process {file_path.name}: no chunk could be embedded.")
+                return False
+
+            # Re-indexing a call replaces its rows instead of adding more;
+            # a call that is now silent loses its old rows too.
+            async with self.write_slots or nullcontext():
+                await asyncio.to_thread(self.delete_file_rows, file_path)
+                if chunks_to_insert:
+                    await asyncio.to_thread(self.writer.write, chunks_to_insert)
+            print(f"Finished {file_path.name}: Created {len(chunks_to_insert)} larger chunks.")
+            return True
 
         except Exception as e:
             print(f"Failed to process {file_path.name}: {e}")
+            return False
 
     async def run_indexer(self, files_to_process=None):
-        if files_to_process:
-            for f in files_to_process:
-                await self.index_file(f)
+        """Indexes the given calls (or every call under root_dir).
+
+        Calls are transcribed on the ASR workers while the transcripts that
+        are already finished go through analysis, embedding and inserts, so
+        the LLM and embedding round-trips overlap with Whisper. At most two
+        calls per ASR worker are in progress at once.
+
+        Returns the files that were indexed successfully.
+        """
+        indexed = []
+        streaming = files_to_process is not None and not isinstance(
+            files_to_process, (list, tuple)
+        )
+        if files_to_process is not None:
+            files = iter(files_to_process)
         else:
-            for f in self.root_dir.rglob("*.wav"):
-                if f.is_file() and self.audio_pattern.match(f.name):
-                    await self.index_file(f)
+            files = (
+                f
+                for f in self.root_dir.rglob("*.wav")
+                if f.is_file() and self.audio_pattern.match(f.name)
+            )
+
+        # One window waiting per worker on top of those being transcribed.
+        self.window_slots = asyncio.Semaphore(2 * self.asr_workers)
+        # Shared by every call in progress.
+        self.llm_slots = asyncio.Semaphore(AUDIO_LLM_CONCURRENCY)
+        self.embed_slots = asyncio.Semaphore(AUDIO_EMBED_CONCURRENCY)
+        self.write_slots = asyncio.Semaphore(AUDIO_WRITE_CONCURRENCY)
+        if self.asr_workers > 1:
+            self.asr_pool = ProcessPoolExecutor(
+                max_workers=self.asr_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=transcription.init_worker,
+                initargs=(self.asr_threads, self.vad_options),
+            )
+
+        async def index(f):
+            if await self.index_file(f):
+                indexed.append(f)
+
+        in_progress = set()
+        max_in_progress = max(2 * self.asr_workers, AUDIO_CALLS_IN_PROGRESS)
+        try:
+            while True:
+                if len(in_progress) >= max_in_progress:
+                    await asyncio.wait(in_progress, return_when=asyncio.FIRST_COMPLETED)
+                # A generator such as SharePointSync.iter_sync() blocks until
+                # the next download finishes, so it is read off the event loop.
+                f = await asyncio.to_thread(next, files, None) if streaming else next(files, None)
+                if f is None:
+                    break
+                task = asyncio.create_task(index(f))
+                in_progress.add(task)
+                task.add_done_callback(in_progress.discard)
+            if in_progress:
+                await asyncio.gather(*in_progress)
+        finally:
+            # After an error, stop the calls still in flight before their
+            # semaphores and the ASR pool go away.
+            for task in in_progress:
+                task.cancel()
+            if in_progress:
+                await asyncio.gather(*in_progress, return_exceptions=True)
+            self.window_slots = self.llm_slots = self.embed_slots = self.write_slots = None
+            if self.asr_pool is not None:
+                await asyncio.to_thread(self.asr_pool.shutdown, cancel_futures=True)
+                self.asr_pool = None
+
+        if self.embedder.cache is not None:
+            stats = self.embedder.cache.stats()
+            print(
+                f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries"
+            )
+        print(f"Embedding requests: {self.embedder.scheduler.metrics()}")
+        if self.transcript_cache is not None:
+            stats = self.transcript_cache.stats()
+            print(
+                f"Transcript cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries ({stats['bytes'] // (1024 * 1024)} MB)"
+            )
+        return indexed
 
 
 # --- Part 3: Interactive Chat Agent Audio ---
@@ -497,20 +659,34 @@ class ChatAgent:
 
 
 # --- Scheduled Indexing Execution Flow ---
-async def scheduled_audio_indexing():
+async def scheduled_audio_indexing(wait=False):
+    """Syncs and indexes the call library under its SyncLock (see
+    indexer.scheduled_indexing)."""
     DOWNLOAD_DIR = Path("./downloads_audio")
 
-    # 1. Run SharePoint Sync
-    syncer = SharePointSync(DOWNLOAD_DIR)
-    updated_files = syncer.run()
-
-    # 2. Run Indexer
-    indexer = KnowledgeBaseIndexer(DOWNLOAD_DIR)
-
-    if updated_files:
-        await indexer.run_indexer(updated_files)
-    else:
-        print("No new files from SharePoint.")
+    lock = SyncLock("audio")
+    if not await asyncio.to_thread(lock.acquire, wait):
+        print("Skipping audio sync: another process is syncing the library.")
+        return 0
+    try:
+        # 1. Run SharePoint Sync and 2. the Indexer together: each call is
+        # indexed as soon as its download finishes.
+        syncer = SharePointSync(DOWNLOAD_DIR)
+        indexer = KnowledgeBaseIndexer(DOWNLOAD_DIR)
+        indexed = await indexer.run_indexer(syncer.iter_sync())
+        syncer.mark_indexed(indexed)
+
+        if not syncer.updated_files:
+            print("No new files from SharePoint.")
+
+        # 3. Drop the chunks of calls that were deleted or moved.
+        if CHUNK_GC_ENABLED:
+            await asyncio.to_thread(
+                collect_orphans, syncer, indexer.supabase, indexer.db_schema, indexer.db_table
+            )
+        return len(indexed)
+    finally:
+        lock.release()
 
 
 # --- Execution ---
@@ -0,0 +1,164 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import psycopg
+    from psycopg import sql
+except ImportError:  # Optional: only needed for the direct COPY path
+    psycopg = None
+
+
+class BulkWriteError(Exception):
+    def __init__(self, written, failed, error):
+        super().__init__(f"{failed} rows failed after retries ({written} written): {error}")
+        self.written = written
+        self.failed = failed
+
+
+def vector_literal(vector):
+    """pgvector text form with 7 significant digits (float32 precision)."""
+    return "[" + ",".join(f"{x:.7g}" for x in vector) + "]"
+
+
+# --- Bulk Row Writer ---
+class BulkWriter:
+    """Inserts rows into a table in payload-sized batches.
+
+    Batches are packed up to `max_batch_bytes` of JSON (a row with a 1536
+    float embedding is ~30 KB, so a fixed row count is a poor fit). Up to
+    `concurrency` batches are in flight at once, shared by every caller of
+    the writer. A failed batch is retried on its own with jittered
+    exponential backoff, so batches that already succeeded are never sent
+    again.
+
+    With `db_url` set (and psycopg installed) rows are streamed with a
+    direct Postgres COPY instead of PostgREST, sending embeddings in
+    pgvector's text form rather than full-precision JSON.
+    """
+
+    def __init__(
+        self,
+        supabase,
+        schema,
+        table,
+        max_batch_bytes=2 * 1024 * 1024,
+        max_batch_rows=500,
+        concurrency=4,
+        max_retries=5,
+        db_url=None,
+    ):
+        self.supabase = supabase
+        self.schema = schema
+        self.table = table
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_rows = max_batch_rows
+        self.max_retries = max_retries
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix=f"bulk-{table}"
+        )
+
+        if db_url and psycopg is None:
+            print("SUPABASE_DB_URL is set but psycopg is not installed; using PostgREST.")
+            db_url = None
+        self.db_url = db_url
+        # One COPY connection per writer thread.
+        self.local = threading.local()
+
+    def pack(self, rows):
+        batches = []
+        current, current_bytes = [], 0
+        for row in rows:
+            size = len(json.dumps(row, separators=(",", ":")))
+            if current and (
+                current_bytes + size > self.max_batch_bytes
+                or len(current) >= self.max_batch_rows
+            ):
+                batches.append(current)
+                current, current_bytes = [], 0
+            current.append(row)
+            current_bytes += size
+        if current:
+            batches.append(current)
+        return batches
+
+    def write(self, rows):
+        """Writes all rows; returns the count or raises BulkWriteError."""
+        if not rows:
+            return 0
+
+        batches = self.pack(rows)
+        futures = [
+            self.executor.submit(self._write_with_retry, batch) for batch in batches
+        ]
+
+        written, failed, error = 0, 0, None
+        for future, batch in zip(futures, batches):
+            try:
+                written += future.result()
+            except Exception as e:
+                failed += len(batch)
+                error = e
+
+        if failed:
+            raise BulkWriteError(written, failed, error)
+        return written
+
+    def _write_with_retry(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.db_url:
+                    self._copy(batch)
+                else:
+                    (
+                        self.supabase.schema(self.schema)
+                        .table(self.table)
+                        .insert(batch)
+                        .execute()
+                    )
+                return len(batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(30, 0.5 * 2**attempt) * random.uniform(0.5, 1.0)
+                print(
+                    f"Insert of {len(batch)} rows into {self.table} failed ({e}); "
+                    f"retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None or conn.closed:
+            conn = psycopg.connect(self.db_url, autocommit=False)
+            self.local.conn = conn
+        return conn
+
+    def _copy(self, batch):
+        columns = list(batch[0].keys())
+        statement = sql.SQL("COPY {}.{} ({}) FROM STDIN").format(
+            sql.Identifier(self.schema),
+            sql.Identifier(self.table),
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+        )
+
+        conn = self._connection()
+        try:
+            with conn.cursor() as cur, cur.copy(statement) as copy:
+                for row in batch:
+                    copy.write_row([self._encode(column, row[column]) for column in columns])
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+    @staticmethod
+    def _encode(column, value):
+        if column == "embedding":
+            return vector_literal(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return value
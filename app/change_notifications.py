@@ -0,0 +1,336 @@
+import sys
+import json
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from config import (
+    NOTIFICATION_HOST,
+    NOTIFICATION_PORT,
+    NOTIFICATION_URL,
+    NOTIFICATION_CLIENT_STATE,
+    NOTIFICATION_DEBOUNCE_SECONDS,
+    NOTIFICATION_MAX_DELAY_SECONDS,
+    NOTIFICATION_SUBSCRIPTIONS_PATH,
+    NOTIFICATION_RENEW_HOURS,
+)
+
+# Graph allows driveItem subscriptions of up to ~30 days.
+SUBSCRIPTION_MINUTES = 42300
+# A failed renewal is retried this soon rather than a full interval later.
+RENEW_RETRY_SECONDS = 15 * 60
+
+
+# --- Debounced Change Queue ---
+class ChangeQueue:
+    """Collects change signals per target and runs its handler once things settle.
+
+    A target's handler runs after `debounce_seconds` without new signals,
+    or at the latest `max_delay_seconds` after the first one, so a burst of
+    edits becomes a single sync. Signals for a target that arrive while its
+    handler is running queue exactly one follow-up run. Each target has
+    its own worker thread, so a slow audio sync never delays documents.
+    """
+
+    def __init__(self, handlers, debounce_seconds=30, max_delay_seconds=300):
+        self.handlers = handlers
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.condition = threading.Condition()
+        # target -> (first signal, last signal)
+        self.pending = {}
+        self.runs = {target: 0 for target in handlers}
+
+        for target in handlers:
+            threading.Thread(
+                target=self._worker, args=(target,), name=f"changes-{target}", daemon=True
+            ).start()
+
+    def notify(self, target):
+        if target not in self.handlers:
+            return False
+        now = time.monotonic()
+        with self.condition:
+            first, _ = self.pending.get(target, (now, now))
+            self.pending[target] = (first, now)
+            self.condition.notify_all()
+        return True
+
+    def _worker(self, target):
+        while True:
+            with self.condition:
+                while True:
+                    if target in self.pending:
+                        first, last = self.pending[target]
+                        due = min(
+                            last + self.debounce_seconds, first + self.max_delay_seconds
+                        )
+                        wait = due - time.monotonic()
+                        if wait <= 0:
+                            del self.pending[target]
+                            break
+                        self.condition.wait(wait)
+                    else:
+                        self.condition.wait()
+
+            print(f"Changes detected in {target}; syncing...")
+            try:
+                self.handlers[target]()
+            except Exception as e:
+                print(f"Incremental sync of {target} failed: {e}")
+            with self.condition:
+                self.runs[target] += 1
+                self.condition.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Blocks until nothing is pending (used by tests and the emulator)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+
+# --- Notification Receiver ---
+class NotificationReceiver:
+    """HTTP endpoint for Microsoft Graph change notifications.
+
+    Answers the subscription validation handshake, checks `clientState`
+    and maps each notification's resource (`drives/{drive_id}/root`) to a
+    target in the ChangeQueue. Graph expects a reply within a few seconds,
+    so requests only enqueue; the sync itself happens on the queue's
+    workers.
+    """
+
+    def __init__(self, queue, drive_targets, client_state, host="0.0.0.0", port=8081):
+        if not client_state:
+            # An empty secret would accept any POST with "clientState": "".
+            raise ValueError("NOTIFICATION_CLIENT_STATE must be set to serve notifications.")
+        self.queue = queue
+        self.drive_targets = drive_targets  # drive id -> target
+        self.client_state = client_state
+        self.received = 0
+        self.rejected = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def target_for(self, resource):
+        for drive_id, target in self.drive_targets.items():
+            if f"drives/{drive_id}" in resource:
+                return target
+        return None
+
+    def handle(self, payload):
+        for notification in payload.get("value", []):
+            if notification.get("clientState") != self.client_state:
+                self.rejected += 1
+                continue
+            self.received += 1
+            target = self.target_for(notification.get("resource", ""))
+            if target:
+                self.queue.notify(target)
+
+    def _handler_class(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body=b"", content_type="text/plain"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                query = parse_qs(urlparse(self.path).query)
+                if "validationToken" in query:
+                    # Subscription handshake: echo the token as plain text.
+                    self._reply(200, query["validationToken"][0].encode("utf-8"))
+                    return
+
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._reply(400)
+                    return
+                receiver.handle(payload)
+                self._reply(202)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# --- Subscriptions ---
+def subscribe(graph, drive_id, notification_url, client_state, store_path=None):
+    """Creates (or renews) a change subscription on a drive's root."""
+    if not client_state:
+        raise ValueError("NOTIFICATION_CLIENT_STATE must be set to subscribe.")
+    store_path = Path(store_path or NOTIFICATION_SUBSCRIPTIONS_PATH)
+    subscriptions = json.loads(store_path.read_text()) if store_path.exists() else {}
+    expiration = (
+        datetime.now(timezone.utc) + timedelta(minutes=SUBSCRIPTION_MINUTES)
+    ).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
+    existing = subscriptions.get(drive_id)
+    if existing:
+        resp = graph.request(
+            "PATCH", f"/subscriptions/{existing}", json={"expirationDateTime": expiration}
+        )
+        if resp.status_code < 400:
+            return existing
+
+    resp = graph.post(
+        "/subscriptions",
+        json={
+            "changeType": "updated",
+            "notificationUrl": notification_url,
+            "resource": f"/drives/{drive_id}/root",
+            "expirationDateTime": expiration,
+            "clientState": client_state,
+        },
+    )
+    resp.raise_for_status()
+    subscriptions[drive_id] = resp.json()["id"]
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    store_path.write_text(json.dumps(subscriptions, indent=4))
+    return subscriptions[drive_id]
+
+
+def renew_subscriptions(graph, drive_ids, notification_url, client_state, interval_seconds):
+    """Starts a daemon thread that renews the drives' subscriptions now and
+    then every `interval_seconds`, long before Graph expires them."""
+
+    def renew():
+        while True:
+            delay = interval_seconds
+            for drive_id in drive_ids:
+                try:
+                    subscription = subscribe(graph, drive_id, notification_url, client_state)
+                    print(f"Renewed subscription {subscription} on drive {drive_id}.")
+                except Exception as e:
+                    print(f"Renewing the subscription on drive {drive_id} failed: {e}")
+                    delay = min(delay, RENEW_RETRY_SECONDS)
+            time.sleep(delay)
+
+    thread = threading.Thread(target=renew, name="subscription-renewal", daemon=True)
+    thread.start()
+    return thread
+
+
+# --- Local Stand-in ---
+def emulate_notification(url, drive_id, client_state, validate=False):
+    """Sends what Graph would send for a change on `drive_id` (or its
+    validation request). Lets the receiver be exercised without Graph."""
+    if validate:
+        token = "validation-" + str(int(time.time()))
+        with urllib.request.urlopen(
+            urllib.request.Request(f"{url}?validationToken={token}", method="POST")
+        ) as resp:
+            return resp.status, resp.read().decode("utf-8")
+
+    body = json.dumps(
+        {
+            "value": [
+                {
+                    "subscriptionId": "emulated",
+                    "clientState": client_state,
+                    "changeType": "updated",
+                    "resource": f"drives/{drive_id}/root",
+                    "tenantId": "emulated",
+                }
+            ]
+        }
+    ).encode("utf-8")
+    request = urllib.request.Request(
+        url, data=body, method="POST", headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as resp:
+        return resp.status, None
+
+
+# --- Execution ---
+def build_targets():
+    """Sync syncer/indexer pairs for both libraries, keyed by drive id."""
+    import asyncio
+    import audio_ingestion
+    import indexer
+
+    targets = {}
+    # Wait for the library's SyncLock instead of skipping, so a change that
+    # arrives during a scheduled run is still synced right after it.
+    handlers = {
+        "documents": lambda: indexer.scheduled_indexing(wait=True),
+        "audio": lambda: asyncio.run(audio_ingestion.scheduled_audio_indexing(wait=True)),
+    }
+    for target, syncer in (
+        ("documents", indexer.SharePointSync(Path("./downloads"))),
+        ("audio", audio_ingestion.SharePointSync(Path("./downloads_audio"))),
+    ):
+        _, drive_id = syncer.get_site_and_drive()
+        targets[drive_id] = target
+    return targets, handlers
+
+
+if __name__ == "__main__":
+    from graph_client import get_graph_client
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    if command == "emulate":
+        # python app/change_notifications.py emulate <receiver url> <drive id>
+        print(emulate_notification(sys.argv[2], sys.argv[3], NOTIFICATION_CLIENT_STATE))
+        sys.exit(0)
+
+    if not NOTIFICATION_CLIENT_STATE:
+        sys.exit("NOTIFICATION_CLIENT_STATE is empty; set it to a random secret first.")
+
+    drive_targets, handlers = build_targets()
+    if command == "subscribe":
+        for drive_id, target in drive_targets.items():
+            subscription = subscribe(
+                get_graph_client(), drive_id, NOTIFICATION_URL, NOTIFICATION_CLIENT_STATE
+            )
+            print(f"{target}: subscription {subscription}")
+    else:
+        queue = ChangeQueue(
+            handlers, NOTIFICATION_DEBOUNCE_SECONDS, NOTIFICATION_MAX_DELAY_SECONDS
+        )
+        receiver = NotificationReceiver(
+            queue,
+            drive_targets,
+            NOTIFICATION_CLIENT_STATE,
+            NOTIFICATION_HOST,
+            NOTIFICATION_PORT,
+        )
+        if NOTIFICATION_URL:
+            renew_subscriptions(
+                get_graph_client(),
+                list(drive_targets),
+                NOTIFICATION_URL,
+                NOTIFICATION_CLIENT_STATE,
+                NOTIFICATION_RENEW_HOURS * 3600,
+            )
+        else:
+            print("NOTIFICATION_URL is not set; subscriptions will not be renewed.")
+        print(f"Listening for change notifications on port {receiver.port}...")
+        receiver.server.serve_forever()
@@ -0,0 +1,147 @@
+import sys
+from pathlib import Path
+
+from config import CHUNK_GC_MAX_ORPHAN_FRACTION
+
+
+def stored_filepaths(supabase, schema, table, page_size=1000):
+    """Returns {metadata.filepath: [row ids]} for every row in the table.
+
+    Pages by id (keyset) so late pages cost the same as the first.
+    """
+    stored = {}
+    last_id = None
+    while True:
+        query = (
+            supabase.schema(schema)
+            .table(table)
+            .select("id, filepath:metadata->>filepath")
+            .order("id")
+            .limit(page_size)
+        )
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data
+        for row in rows:
+            if row["filepath"]:
+                stored.setdefault(row["filepath"], []).append(row["id"])
+        if len(rows) < page_size:
+            return stored
+        last_id = rows[-1]["id"]
+
+
+def delete_rows(supabase, schema, table, row_ids, batch_size=200):
+    # Keep the id list short enough for the PostgREST query string.
+    for i in range(0, len(row_ids), batch_size):
+        (
+            supabase.schema(schema)
+            .table(table)
+            .delete()
+            .in_("id", row_ids[i : i + batch_size])
+            .execute()
+        )
+
+
+# --- Orphan Chunk Garbage Collection ---
+def collect_orphans(
+    syncer,
+    supabase,
+    schema,
+    table,
+    manifest=None,
+    dry_run=False,
+    force=False,
+    max_orphan_fraction=CHUNK_GC_MAX_ORPHAN_FRACTION,
+):
+    """Deletes indexed rows whose file is no longer in the synced library.
+
+    A row is an orphan when its `metadata.filepath` lies under the syncer's
+    download directory but is not one of the files in its sync store (the
+    file was deleted in SharePoint, or renamed/moved and indexed again
+    under its new path). Orphan rows are deleted in bulk, their local
+    copies removed and their manifest entries dropped.
+
+    As a safety net nothing is deleted when the store is empty or still
+    has files without a path, or when more than `max_orphan_fraction` of
+    the stored files would go unless `force` is set.
+    """
+    stats = {"files": 0, "rows": 0, "local_files": 0}
+    inventory = syncer.store.file_paths()
+    if not inventory:
+        print(f"Skipping {table} cleanup: the sync store is empty.")
+        return stats
+
+    if not all(inventory):
+        # Rows migrated from the old JSON state get their path on the next
+        # sync; until then any stored filepath might still belong to them.
+        print(
+            f"Skipping {table} cleanup: {inventory.count('')} synced files have no "
+            f"path yet (run a sync first)."
+        )
+        return stats
+
+    live = {str(syncer.local_path(path)) for path in inventory}
+    stored = {
+        filepath: ids
+        for filepath, ids in stored_filepaths(supabase, schema, table).items()
+        if Path(filepath).is_relative_to(syncer.download_dir)
+    }
+    orphans = {filepath: ids for filepath, ids in stored.items() if filepath not in live}
+    if not orphans:
+        print(f"No orphaned rows in {schema}.{table}.")
+        return stats
+
+    if not force and len(orphans) > max_orphan_fraction * len(stored):
+        print(
+            f"Refusing to clean up {table}: {len(orphans)} of {len(stored)} indexed "
+            f"files are missing from the sync store (run with --force if expected)."
+        )
+        return stats
+
+    stats["files"] = len(orphans)
+    stats["rows"] = sum(len(ids) for ids in orphans.values())
+    if dry_run:
+        print(f"Would delete {stats['rows']} rows of {stats['files']} files from {schema}.{table}.")
+        return stats
+
+    delete_rows(supabase, schema, table, [i for ids in orphans.values() for i in ids])
+    for filepath in orphans:
+        local_path = Path(filepath)
+        if local_path.is_file():
+            local_path.unlink()
+            stats["local_files"] += 1
+        if manifest is not None:
+            manifest.forget(local_path)
+    if manifest is not None:
+        manifest.save()
+
+    print(
+        f"Reclaimed {stats['rows']} rows of {stats['files']} removed files from "
+        f"{schema}.{table} ({stats['local_files']} local copies deleted)."
+    )
+    return stats
+
+
+# --- Execution ---
+if __name__ == "__main__":
+    # python app/chunk_gc.py [documents|audio] [--dry-run] [--force]
+    target = next((arg for arg in sys.argv[1:] if not arg.startswith("--")), "documents")
+    if target == "audio":
+        import audio_ingestion as module
+
+        download_dir = Path("./downloads_audio")
+    else:
+        import indexer as module
+
+        download_dir = Path("./downloads")
+
+    kb = module.KnowledgeBaseIndexer(download_dir)
+    collect_orphans(
+        module.SharePointSync(download_dir),
+        kb.supabase,
+        kb.db_schema,
+        kb.db_table,
+        getattr(kb, "manifest", None),
+        dry_run="--dry-run" in sys.argv,
+        force="--force" in sys.argv,
+    )
@@ -1,9 +1,16 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from supabase import create_client, Client
 import openai
+import tiktoken
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 
+from embedding_cache import EmbeddingCache
+from rate_limiter import RateLimitedScheduler, RetryableError, parse_duration
+
 
 load_dotenv()
 
@@ -15,6 +22,127 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_SCHEMA = os.getenv("SUPABASE_SCHEMA", "documents_rag")
 SUPABASE_TABLE = os.getenv("SUPABASE_TABLE", "chunks")
 SUPABASE_AUDIO_TABLE = os.getenv("SUPABASE_AUDIO_TABLE", "audio_chunks")
+INDEXER_REINDEX_MODE = os.getenv("INDEXER_REINDEX_MODE", "diff").lower()
+# Upper bound on tokens per indexed chunk (capped at the embedding model limit).
+INDEXER_CHUNK_MAX_TOKENS = int(os.getenv("INDEXER_CHUNK_MAX_TOKENS", "512"))
+INDEXER_MANIFEST_PATH = os.getenv("INDEXER_MANIFEST_PATH", "index_manifest.json")
+# Set CONVERSION_CACHE_DIR to an empty string to disable the conversion cache.
+CONVERSION_CACHE_DIR = os.getenv("CONVERSION_CACHE_DIR", ".cache/conversions")
+CONVERSION_CACHE_MAX_MB = int(os.getenv("CONVERSION_CACHE_MAX_MB", "2048"))
+# Set TRANSCRIPT_CACHE_DIR to an empty string to disable the transcript cache.
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", ".cache/transcripts")
+TRANSCRIPT_CACHE_MAX_MB = int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "1024"))
+INDEXER_CONVERSION_WORKERS = int(os.getenv("INDEXER_CONVERSION_WORKERS", "1"))
+INDEXER_CONVERSION_INFLIGHT_MB = int(os.getenv("INDEXER_CONVERSION_INFLIGHT_MB", "512"))
+# Concurrency of the indexing pipeline stages after conversion and the size
+# of the bounded queues between them.
+INDEXER_CHUNK_WORKERS = int(os.getenv("INDEXER_CHUNK_WORKERS", "2"))
+INDEXER_EMBED_WORKERS = int(os.getenv("INDEXER_EMBED_WORKERS", "4"))
+INDEXER_WRITE_WORKERS = int(os.getenv("INDEXER_WRITE_WORKERS", "2"))
+INDEXER_PIPELINE_QUEUE_SIZE = int(os.getenv("INDEXER_PIPELINE_QUEUE_SIZE", "8"))
+
+# SharePoint sync: "delta" follows the Graph delta feed (only changes are
+# fetched), "crawl" lists every folder on each run.
+SHAREPOINT_SYNC_MODE = os.getenv("SHAREPOINT_SYNC_MODE", "delta").lower()
+# Parallel downloads; transfers that break off after RESUME_MB continue
+# with a Range request instead of starting over.
+SHAREPOINT_DOWNLOAD_WORKERS = int(os.getenv("SHAREPOINT_DOWNLOAD_WORKERS", "8"))
+SHAREPOINT_DOWNLOAD_CHUNK_KB = int(os.getenv("SHAREPOINT_DOWNLOAD_CHUNK_KB", "1024"))
+SHAREPOINT_DOWNLOAD_RESUME_MB = int(os.getenv("SHAREPOINT_DOWNLOAD_RESUME_MB", "8"))
+
+# Graph client shared by the sync jobs: persistent MSAL token cache (empty
+# disables), seconds before expiry a token is replaced, and how long
+# resolved site/drive ids are reused.
+GRAPH_TOKEN_CACHE_PATH = os.getenv("GRAPH_TOKEN_CACHE_PATH", ".cache/msal_token_cache.json")
+GRAPH_TOKEN_REFRESH_MARGIN = int(os.getenv("GRAPH_TOKEN_REFRESH_MARGIN", "300"))
+GRAPH_RESOLVE_CACHE_PATH = os.getenv("GRAPH_RESOLVE_CACHE_PATH", ".cache/graph_ids.json")
+GRAPH_RESOLVE_TTL_HOURS = float(os.getenv("GRAPH_RESOLVE_TTL_HOURS", "24"))
+
+# jobs/indexing.py: run intervals, worker threads for the (blocking)
+# document job and where per-run metrics are appended.
+DOCUMENT_JOB_INTERVAL_HOURS = float(os.getenv("DOCUMENT_JOB_INTERVAL_HOURS", "24"))
+AUDIO_JOB_INTERVAL_HOURS = float(os.getenv("AUDIO_JOB_INTERVAL_HOURS", "24"))
+DOCUMENT_JOB_THREADS = int(os.getenv("DOCUMENT_JOB_THREADS", "1"))
+JOB_METRICS_PATH = os.getenv("JOB_METRICS_PATH", "job_runs.jsonl")
+# Lock files that keep the jobs and the change-notification receiver from
+# syncing the same library at once (app/sync_lock.py).
+SYNC_LOCK_DIR = os.getenv("SYNC_LOCK_DIR", ".cache/locks")
+
+# app/change_notifications.py: where the receiver listens, the public
+# https URL Graph posts to, the shared clientState secret, how long a
+# library must stay quiet (capped by the max delay) before it is synced,
+# where subscription ids are kept for renewal and how often `serve`
+# renews them.
+NOTIFICATION_HOST = os.getenv("NOTIFICATION_HOST", "0.0.0.0")
+NOTIFICATION_PORT = int(os.getenv("NOTIFICATION_PORT", "8081"))
+NOTIFICATION_URL = os.getenv("NOTIFICATION_URL", "")
+NOTIFICATION_CLIENT_STATE = os.getenv("NOTIFICATION_CLIENT_STATE", "")
+NOTIFICATION_DEBOUNCE_SECONDS = float(os.getenv("NOTIFICATION_DEBOUNCE_SECONDS", "30"))
+NOTIFICATION_MAX_DELAY_SECONDS = float(os.getenv("NOTIFICATION_MAX_DELAY_SECONDS", "300"))
+NOTIFICATION_SUBSCRIPTIONS_PATH = os.getenv(
+    "NOTIFICATION_SUBSCRIPTIONS_PATH", ".cache/graph_subscriptions.json"
+)
+NOTIFICATION_RENEW_HOURS = float(os.getenv("NOTIFICATION_RENEW_HOURS", "24"))
+
+# Orphan cleanup after each scheduled sync (app/chunk_gc.py): deletes rows
+# of files that are gone from SharePoint. It refuses to run when more than
+# this fraction of the indexed files would be deleted.
+CHUNK_GC_ENABLED = os.getenv("CHUNK_GC_ENABLED", "true").lower() == "true"
+CHUNK_GC_MAX_ORPHAN_FRACTION = float(os.getenv("CHUNK_GC_MAX_ORPHAN_FRACTION", "0.5"))
+
+# Audio transcription: more than one worker runs Whisper in a process pool
+# (one model per worker); threads per worker, 0 splits the cores evenly.
+AUDIO_ASR_WORKERS = int(os.getenv("AUDIO_ASR_WORKERS", "1"))
+AUDIO_ASR_THREADS = int(os.getenv("AUDIO_ASR_THREADS", "0"))
+# Voice activity detection before ASR: frames more than AUDIO_VAD_TOP_DB
+# below the loudest are silence; shorter pauses than the minimum are kept.
+AUDIO_VAD_ENABLED = os.getenv("AUDIO_VAD_ENABLED", "true").lower() == "true"
+AUDIO_VAD_TOP_DB = float(os.getenv("AUDIO_VAD_TOP_DB", "35"))
+AUDIO_VAD_MIN_SILENCE_SECONDS = float(os.getenv("AUDIO_VAD_MIN_SILENCE_SECONDS", "0.6"))
+# Calls longer than one window are split into windows of this length
+# (plus the overlap shared with the next one) and transcribed in parallel.
+AUDIO_WINDOW_SECONDS = float(os.getenv("AUDIO_WINDOW_SECONDS", "600"))
+AUDIO_WINDOW_OVERLAP_SECONDS = float(os.getenv("AUDIO_WINDOW_OVERLAP_SECONDS", "10"))
+# Calls indexed at the same time (at least two per ASR worker), and limits
+# shared by all of them on concurrent analysis (LLM), embedding and write
+# calls.
+AUDIO_CALLS_IN_PROGRESS = int(os.getenv("AUDIO_CALLS_IN_PROGRESS", "8"))
+AUDIO_LLM_CONCURRENCY = int(os.getenv("AUDIO_LLM_CONCURRENCY", "4"))
+AUDIO_EMBED_CONCURRENCY = int(os.getenv("AUDIO_EMBED_CONCURRENCY", "4"))
+AUDIO_WRITE_CONCURRENCY = int(os.getenv("AUDIO_WRITE_CONCURRENCY", "2"))
+
+# Bulk inserts: batches are sized by JSON payload bytes. Setting
+# SUPABASE_DB_URL (a direct Postgres connection string, requires psycopg)
+# switches inserts to COPY.
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
+BULK_WRITE_MAX_BYTES = int(os.getenv("BULK_WRITE_MAX_BYTES", str(2 * 1024 * 1024)))
+BULK_WRITE_CONCURRENCY = int(os.getenv("BULK_WRITE_CONCURRENCY", "4"))
+BULK_WRITE_MAX_RETRIES = int(os.getenv("BULK_WRITE_MAX_RETRIES", "5"))
+
+EMBEDDING_MODELS = {
+    "openai": "text-embedding-3-small",
+    "gemini": "models/embedding-001",
+}
+
+# Per-request limits used to pack batch embedding calls.
+# max_inputs: texts per request, max_tokens: total tokens per request,
+# max_input_tokens: longest single text the model accepts.
+EMBEDDING_BATCH_LIMITS = {
+    "openai": {"max_inputs": 2048, "max_tokens": 300000, "max_input_tokens": 8191},
+    "gemini": {"max_inputs": 100, "max_tokens": 200000, "max_input_tokens": 2048},
+}
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "0"))
+
+# Client-side embedding rate limits. The limits are replaced by the
+# provider's x-ratelimit-* headers once a response reports them.
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "8"))
+
+# Set EMBEDDING_CACHE_PATH to an empty string to disable the on-disk cache.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
 
 DEPARTMENT_LIST = {
     "Gestion Humana": "HR",
@@ -35,33 +163,182 @@ class EmbeddingService:
     def __init__(self):
         self.service = LLM_SERVICE
         self.api_key = LLM_API_KEY
+        self.model = EMBEDDING_MODELS.get(self.service)
+        self._tokenizer = None
+        self.cache = (
+            EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+            if EMBEDDING_CACHE_PATH
+            else None
+        )
+
+        # Retries are handled by the scheduler, not the SDK.
+        self.scheduler = RateLimitedScheduler(
+            EMBEDDING_REQUESTS_PER_MINUTE,
+            EMBEDDING_TOKENS_PER_MINUTE,
+            max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+            max_retries=EMBEDDING_MAX_RETRIES,
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=EMBEDDING_MAX_CONCURRENCY, thread_name_prefix="embeddings"
+        )
 
         if self.service == "openai":
-            self.client = openai.OpenAI(api_key=self.api_key)
+            self.client = openai.OpenAI(api_key=self.api_key, max_retries=0)
         elif self.service == "gemini":
             genai.configure(api_key=self.api_key)
 
+    @property
+    def tokenizer(self):
+        # cl100k_base is the text-embedding-3 tokenizer; for Gemini it is
+        # only used as an estimate when packing batches. Loaded lazily since
+        # tiktoken may need to download the encoding on first use.
+        if self._tokenizer is None:
+            self._tokenizer = tiktoken.get_encoding("cl100k_base")
+        return self._tokenizer
+
     def get_embedding(self, text):
-        text = text.replace("\n", " ")
         try:
-            if self.service == "openai":
-                response = self.client.embeddings.create(
-                    input=[text], model="text-embedding-3-small"
-                )
-                return response.data[0].embedding
-            elif self.service == "gemini":
-                result = genai.embed_content(
-                    model="models/embedding-001",
-                    content=text,
-                    task_type="retrieval_query",
-                )
-                return result["embedding"]
-            else:
-                raise ValueError("Unsupported LLM_SERVICE")
+            return self.get_embeddings([text])[0]
         except Exception as e:
             print(f"Error generating embedding: {e}")
             return None
 
+    def get_embeddings(self, texts):
+        """Embeds many texts with as few requests as possible.
+
+        Returns one vector per input, in input order (None for empty texts).
+        Texts already in the embedding cache are not sent to the provider.
+        Requests are paced and retried by the scheduler; if a batch still
+        fails the error is raised rather than leaving holes in the result.
+        """
+        texts = [text.replace("\n", " ") for text in texts]
+
+        if self.service not in EMBEDDING_BATCH_LIMITS:
+            print("Error generating embedding: Unsupported LLM_SERVICE")
+            return [None] * len(texts)
+
+        if self.cache is None:
+            return self._fetch_embeddings(texts)
+
+        vectors = self.cache.get_many(self.model, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fetched = self._fetch_embeddings(missing_texts)
+            self.cache.put_many(self.model, missing_texts, fetched)
+            for index, vector in zip(missing, fetched):
+                vectors[index] = vector
+
+        return vectors
+
+    def _fetch_embeddings(self, texts):
+        texts = list(texts)
+        vectors = [None] * len(texts)
+
+        batches = self._pack_batches(texts)
+        futures = [
+            self.executor.submit(
+                self.scheduler.run,
+                partial(self._call_provider, [texts[i] for i in batch]),
+                tokens,
+            )
+            for batch, tokens in batches
+        ]
+
+        error = None
+        for (batch, _), future in zip(batches, futures):
+            try:
+                batch_vectors = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            for index, vector in zip(batch, batch_vectors):
+                vectors[index] = vector
+
+        if error is not None:
+            raise error
+        return vectors
+
+    def _call_provider(self, texts):
+        try:
+            return self._embed_batch(texts)
+        except Exception as e:
+            retryable = self._as_retryable(e)
+            if retryable is None:
+                raise
+            raise retryable from e
+
+    def _as_retryable(self, error):
+        """Wraps transient provider errors so the scheduler retries them."""
+        if isinstance(error, openai.RateLimitError):
+            retry_after = parse_duration(error.response.headers.get("retry-after"))
+            return RetryableError(error, rate_limited=True, retry_after=retry_after)
+        if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+            return RetryableError(error)
+        if isinstance(error, google_exceptions.ResourceExhausted):
+            return RetryableError(error, rate_limited=True)
+        if isinstance(
+            error,
+            (
+                google_exceptions.ServiceUnavailable,
+                google_exceptions.DeadlineExceeded,
+                google_exceptions.InternalServerError,
+            ),
+        ):
+            return RetryableError(error)
+        return None
+
+    def _pack_batches(self, texts):
+        """Groups input indexes into provider-sized batches by token count.
+
+        Returns (indexes, token_count) pairs.
+        """
+        limits = EMBEDDING_BATCH_LIMITS[self.service]
+        max_tokens = EMBEDDING_BATCH_MAX_TOKENS or limits["max_tokens"]
+
+        batches = []
+        current, current_tokens = [], 0
+        for index, text in enumerate(texts):
+            if not text.strip():
+                continue
+
+            tokens = self.tokenizer.encode(text, disallowed_special=())
+            if len(tokens) > limits["max_input_tokens"]:
+                tokens = tokens[: limits["max_input_tokens"]]
+                texts[index] = self.tokenizer.decode(tokens)
+
+            if current and (
+                len(current) >= limits["max_inputs"]
+                or current_tokens + len(tokens) > max_tokens
+            ):
+                batches.append((current, current_tokens))
+                current, current_tokens = [], 0
+
+            current.append(index)
+            current_tokens += len(tokens)
+
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    def _embed_batch(self, texts):
+        if self.service == "openai":
+            raw = self.client.embeddings.with_raw_response.create(
+                input=texts, model=self.model
+            )
+            self.scheduler.observe_headers(raw.headers)
+            response = raw.parse()
+            return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        elif self.service == "gemini":
+            result = genai.embed_content(
+                model=self.model,
+                content=texts,
+                task_type="retrieval_query",
+            )
+            return result["embedding"]
+        else:
+            raise ValueError("Unsupported LLM_SERVICE")
+
 
 # --- Helper: Department List Dictionary ---
 
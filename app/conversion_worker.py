@@ -0,0 +1,33 @@
+import os
+
+# Worker-side state for process-pool document conversion. This module is kept
+# free of Supabase/LLM imports so spawned workers only load Docling.
+_converter = None
+
+
+def init_worker(num_threads=1):
+    """Process pool initializer: builds and warms one converter per worker."""
+    global _converter
+
+    # Limit intra-op threads before torch is imported so N workers do not
+    # each spin up one thread per core.
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+
+    from docling.datamodel.base_models import InputFormat
+    from docling.document_converter import DocumentConverter
+
+    try:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+    _converter = DocumentConverter()
+    # Load the layout/OCR models now rather than on the first file.
+    _converter.initialize_pipeline(InputFormat.PDF)
+
+
+def convert(file_path):
+    """Converts one file in the worker and returns its DoclingDocument."""
+    return _converter.convert(file_path).document
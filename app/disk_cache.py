@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+# --- On-Disk JSON Cache ---
+class DiskCache:
+    """Directory of gzip-compressed JSON entries with size-bounded LRU eviction.
+
+    Reads refresh an entry's mtime, so eviction removes the entries that
+    were used least recently once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+        self.total_bytes = sum(p.stat().st_size for p in self._entries())
+
+    def _entries(self):
+        return self.cache_dir.glob("*/*.json.gz")
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json.gz"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            old_size = path.stat().st_size if path.exists() else 0
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Cache write failed for {key}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        with self.lock:
+            self.total_bytes += path.stat().st_size - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Oldest first; stop at 90% of the budget so we don't evict on every put.
+        target = self.max_bytes * 0.9
+        for path in sorted(self._entries(), key=lambda p: p.stat().st_mtime):
+            if self.total_bytes <= target:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def prune(self):
+        with self.lock:
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self.total_bytes = 0
+
+    def stats(self):
+        entries = list(self._entries())
+        oldest = min((p.stat().st_mtime for p in entries), default=None)
+        return {
+            "entries": len(entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "oldest_access": time.ctime(oldest) if oldest else None,
+        }
+
+
+# --- Cache maintenance CLI ---
+# uv run app/disk_cache.py stats .cache/conversions
+# uv run app/disk_cache.py prune .cache/conversions 1024   (max MB)
+# uv run app/disk_cache.py clear .cache/conversions
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("stats", "prune", "clear"):
+        print("Usage: disk_cache.py {stats|prune|clear} CACHE_DIR [MAX_MB]")
+        sys.exit(1)
+
+    command, cache_dir = sys.argv[1], sys.argv[2]
+    max_mb = int(sys.argv[3]) if len(sys.argv) > 3 else 2048
+    cache = DiskCache(cache_dir, max_mb * 1024 * 1024)
+
+    if command == "prune":
+        cache.prune()
+    elif command == "clear":
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=4))
@@ -0,0 +1,123 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Expired pre-authenticated URL or token: retried with a fresh source.
+AUTH_STATUS = {401, 403}
+
+
+class DownloadError(Exception):
+    pass
+
+
+# --- Concurrent Downloader ---
+class Downloader:
+    """Downloads files concurrently over one pooled HTTP session.
+
+    Each file is streamed to `<name>.part` next to its destination and
+    renamed into place only when complete, so readers never see a
+    truncated file. When a transfer of at least `resume_min_bytes` breaks
+    off, the retry asks for the rest with a Range request (guarded by
+    If-Range, so a file that changed in between is fetched again in full)
+    instead of starting over.
+
+    The source may be a callable `source(expired)` returning (url,
+    headers). It is called when the transfer actually starts, and again
+    with expired=True after a 401/403, so URLs and tokens are never stale
+    from waiting in the queue. `submit` blocks while `max_queued` downloads
+    are already waiting or running.
+    """
+
+    def __init__(
+        self,
+        workers=8,
+        chunk_size=1024 * 1024,
+        resume_min_bytes=8 * 1024 * 1024,
+        max_retries=4,
+        timeout=60,
+        max_queued=None,
+    ):
+        self.chunk_size = chunk_size
+        self.resume_min_bytes = resume_min_bytes
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download")
+        self.slots = threading.BoundedSemaphore(max_queued or workers * 4)
+
+    def submit(self, source, path, headers=None):
+        """Queues a download; the future resolves to `path`."""
+        self.slots.acquire()
+        future = self.executor.submit(self.download, source, path, headers)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def download(self, source, path, headers=None):
+        refreshable = callable(source)
+        if not refreshable:
+            url = source
+            source = lambda expired: (url, headers)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".part")
+        tmp.unlink(missing_ok=True)
+        validator = None
+        expired = False
+
+        for attempt in range(self.max_retries + 1):
+            url, source_headers = source(expired)
+            offset = tmp.stat().st_size if tmp.exists() else 0
+            request_headers = dict(source_headers or {})
+            if offset and validator:
+                request_headers["Range"] = f"bytes={offset}-"
+                request_headers["If-Range"] = validator
+
+            retry_after = None
+            try:
+                with self.session.get(
+                    url, headers=request_headers, stream=True, timeout=self.timeout
+                ) as r:
+                    if r.status_code in AUTH_STATUS and refreshable and not expired:
+                        expired = True
+                        retry_after = 0
+                        raise DownloadError(f"HTTP {r.status_code}")
+                    if r.status_code in RETRY_STATUS:
+                        retry_after = r.headers.get("Retry-After")
+                        raise DownloadError(f"HTTP {r.status_code}")
+                    r.raise_for_status()
+                    validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+
+                    # 206: the server honoured the range, append to the
+                    # partial file; anything else is the whole file again.
+                    mode = "ab" if r.status_code == 206 else "wb"
+                    with open(tmp, mode) as f:
+                        for chunk in r.iter_content(self.chunk_size):
+                            f.write(chunk)
+                os.replace(tmp, path)
+                return path
+            except (requests.RequestException, DownloadError) as e:
+                if tmp.exists() and tmp.stat().st_size < self.resume_min_bytes:
+                    tmp.unlink()
+                if attempt == self.max_retries:
+                    tmp.unlink(missing_ok=True)
+                    raise DownloadError(f"{path.name}: {e}") from e
+
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = min(30, 2**attempt) * random.uniform(0.5, 1.0)
+                print(f"Download of {path.name} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
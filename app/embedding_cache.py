@@ -0,0 +1,131 @@
+import array
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+# --- Persistent Embedding Cache ---
+class EmbeddingCache:
+    """Content-addressed embedding store backed by SQLite.
+
+    Entries are keyed on (model, hash of the whitespace-normalized text), so a
+    paragraph that did not change between two revisions of a document is
+    never sent to the embedding provider twice. The table is bounded to
+    `max_entries` rows; the least recently used rows are evicted first.
+    """
+
+    # SQLite limits the number of bound parameters per statement.
+    LOOKUP_BATCH = 500
+
+    def __init__(self, path, max_entries=200_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.split())
+
+    def make_key(self, model, text):
+        digest = hashlib.sha256(self.normalize(text).encode("utf-8")).hexdigest()
+        return f"{model}:{digest}"
+
+    def get_many(self, model, texts):
+        """Returns the cached vector for each text, or None on a miss."""
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+
+        with self.lock:
+            for i in range(0, len(keys), self.LOOKUP_BATCH):
+                batch = keys[i : i + self.LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self.conn.commit()
+
+            vectors = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    vectors.append(None)
+                else:
+                    self.hits += 1
+                    vectors.append(array.array("f", blob).tolist())
+        return vectors
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), model, array.array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+            if vector
+        ]
+        if not rows:
+            return
+
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+
+    def stats(self):
+        with self.lock:
+            (entries,) = self.conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,191 @@
+import os
+import json
+import threading
+import time
+from pathlib import Path
+
+import msal
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    GRAPH_TOKEN_CACHE_PATH,
+    GRAPH_TOKEN_REFRESH_MARGIN,
+    GRAPH_RESOLVE_CACHE_PATH,
+    GRAPH_RESOLVE_TTL_HOURS,
+)
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+GRAPH_SCOPES = ["https://graph.microsoft.com/.default"]
+
+
+def _write_atomic(path, text, private=False):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    if private:
+        os.chmod(tmp, 0o600)  # holds bearer tokens
+    os.replace(tmp, path)
+
+
+# --- Shared Microsoft Graph Client ---
+class GraphClient:
+    """App-only Graph access shared by the SharePoint sync jobs.
+
+    - Tokens come from an MSAL token cache persisted to disk, so a new
+      process reuses the last token instead of authenticating again.
+    - A token is replaced `refresh_margin` seconds before it expires, and
+      a 401 forces a new one and retries once, so long crawls outlive it.
+    - Site and drive ids are cached on disk for `resolve_ttl` seconds.
+    - Requests share one pooled HTTP session.
+    """
+
+    def __init__(
+        self,
+        tenant_id=None,
+        client_id=None,
+        client_secret=None,
+        token_cache_path=GRAPH_TOKEN_CACHE_PATH,
+        refresh_margin=GRAPH_TOKEN_REFRESH_MARGIN,
+        resolve_cache_path=GRAPH_RESOLVE_CACHE_PATH,
+        resolve_ttl=GRAPH_RESOLVE_TTL_HOURS * 3600,
+    ):
+        self.tenant_id = tenant_id or os.getenv("OFFICE_365_TENANT_ID")
+        self.client_id = client_id or os.getenv("OFFICE_365_CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("OFFICE_365_CLIENT_SECRET")
+        self.refresh_margin = refresh_margin
+        self.resolve_ttl = resolve_ttl
+
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires_at = 0
+
+        self.token_cache_path = Path(token_cache_path) if token_cache_path else None
+        self.token_cache = msal.SerializableTokenCache()
+        if self.token_cache_path and self.token_cache_path.exists():
+            self.token_cache.deserialize(self.token_cache_path.read_text())
+        self.app = None
+
+        self.resolve_cache_path = Path(resolve_cache_path) if resolve_cache_path else None
+        self.resolved = {}
+        if self.resolve_cache_path and self.resolve_cache_path.exists():
+            self.resolved = json.loads(self.resolve_cache_path.read_text())
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+
+    # --- Tokens ---
+    def _cached_token(self):
+        """A still-fresh token from the persisted cache, without building
+        the MSAL app (which costs an authority discovery round-trip)."""
+        now = time.time()
+        for entry in self.token_cache.search(
+            msal.TokenCache.CredentialType.ACCESS_TOKEN,
+            query={"client_id": self.client_id, "realm": self.tenant_id},
+        ):
+            expires_on = int(entry.get("expires_on", 0))
+            if expires_on - now > self.refresh_margin:
+                return entry["secret"], expires_on
+        return None
+
+    def _acquire(self, force=False):
+        cached = None if force else self._cached_token()
+        if cached:
+            self.token, self.expires_at = cached
+            return
+
+        if self.app is None:
+            self.app = msal.ConfidentialClientApplication(
+                self.client_id,
+                authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+                client_credential=self.client_secret,
+                token_cache=self.token_cache,
+            )
+        if force:
+            # Drop cached app tokens so MSAL has to fetch a new one.
+            for token in list(
+                self.token_cache.search(msal.TokenCache.CredentialType.ACCESS_TOKEN)
+            ):
+                self.token_cache.remove_at(token)
+
+        result = self.app.acquire_token_for_client(scopes=GRAPH_SCOPES)
+        if "access_token" not in result:
+            raise Exception(f"Auth failed: {result.get('error_description')}")
+
+        self.token = result["access_token"]
+        self.expires_at = time.time() + int(result.get("expires_in", 0))
+        if self.token_cache_path and self.token_cache.has_state_changed:
+            _write_atomic(self.token_cache_path, self.token_cache.serialize(), private=True)
+            self.token_cache.has_state_changed = False
+
+    def auth_headers(self, force_refresh=False):
+        with self.lock:
+            if force_refresh or time.time() >= self.expires_at - self.refresh_margin:
+                self._acquire(force=force_refresh)
+            return {"Authorization": f"Bearer {self.token}"}
+
+    # --- Requests ---
+    def request(self, method, url, **kwargs):
+        if url.startswith("/"):
+            url = GRAPH_URL + url
+        resp = self.session.request(method, url, headers=self.auth_headers(), **kwargs)
+        if resp.status_code == 401:
+            # Revoked or expired early: get a new token and retry once.
+            resp = self.session.request(
+                method, url, headers=self.auth_headers(force_refresh=True), **kwargs
+            )
+        return resp
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    # --- Site / drive resolution ---
+    def resolve_drive(self, site_ref, drive_name):
+        """Returns (site_id, drive_id) for `sites/{site_ref}` and a library name."""
+        key = f"{site_ref}|{drive_name}"
+        with self.lock:
+            cached = self.resolved.get(key)
+        if cached and time.time() - cached["resolved_at"] < self.resolve_ttl:
+            return cached["site_id"], cached["drive_id"]
+
+        # 1. Get Site
+        resp = self.get(f"/sites/{site_ref}")
+        resp.raise_for_status()
+        site_id = resp.json()["id"]
+
+        # 2. Get Drive
+        resp = self.get(f"/sites/{site_id}/drives")
+        resp.raise_for_status()
+        drive_id = next(
+            (d["id"] for d in resp.json()["value"] if d["name"] == drive_name),
+            None,
+        )
+        if not drive_id:
+            raise Exception("Drive not found")
+
+        with self.lock:
+            self.resolved[key] = {
+                "site_id": site_id,
+                "drive_id": drive_id,
+                "resolved_at": time.time(),
+            }
+            if self.resolve_cache_path:
+                _write_atomic(self.resolve_cache_path, json.dumps(self.resolved, indent=4))
+        return site_id, drive_id
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_graph_client():
+    """The process-wide GraphClient used by both sync jobs."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = GraphClient()
+        return _shared_client
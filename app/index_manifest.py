@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Indexed File Manifest ---
+class IndexManifest:
+    """Fingerprints of files already indexed, used to skip unchanged files.
+
+    Each entry stores size, mtime, content hash and the index version (the
+    embedding model and chunking settings). A file is unchanged when its
+    index version matches and either its size and mtime match, or its size
+    matches and its content hash is the same.
+    """
+
+    def __init__(self, path, index_version):
+        self.path = Path(path)
+        self.index_version = index_version
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.entries = json.load(f).get("files", {})
+
+    def is_unchanged(self, file_path):
+        entry = self.entries.get(str(file_path))
+        if not entry or entry["index_version"] != self.index_version:
+            return False
+
+        stat = file_path.stat()
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+
+        # Touched but maybe not modified (e.g. re-downloaded): compare content.
+        if file_sha256(file_path) != entry["sha256"]:
+            return False
+        with self.lock:
+            entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def record(self, file_path, content_hash=None):
+        stat = file_path.stat()
+        entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": content_hash or file_sha256(file_path),
+            "index_version": self.index_version,
+        }
+        with self.lock:
+            self.entries[str(file_path)] = entry
+
+    def forget(self, file_path):
+        with self.lock:
+            self.entries.pop(str(file_path), None)
+
+    def save(self):
+        with self.lock:
+            data = json.dumps({"files": self.entries}, indent=4)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
@@ -1,9 +1,11 @@
 import os
+import sys
 import json
-import requests
-import msal
+import hashlib
 import asyncio
-import dateutil.parser
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from importlib.metadata import version
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -11,11 +13,22 @@ from dotenv import load_dotenv
 from supabase import create_client, Client
 from docling.document_converter import DocumentConverter
 from docling.chunking import HybridChunker  # specific docling chunker
+from docling_core.transforms.chunker.tokenizer.openai import OpenAITokenizer
+from docling_core.types.doc import DoclingDocument
 import openai
 import google.generativeai as genai
 
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+import conversion_worker
+from bulk_writer import BulkWriter
+from chunk_gc import collect_orphans
+from disk_cache import DiskCache
+from index_manifest import IndexManifest, file_sha256
+from pipeline import Pipeline, Stage
+from sharepoint_sync import DriveSync
+from sync_lock import SyncLock
+from text_loaders import FAST_PATH_LOADERS
 from config import (
     global_supabase_client,
     global_embedding_service_instance,
@@ -25,139 +38,122 @@ from config import (
     LLM_SERVICE,
     LLM_API_KEY,
     SUPABASE_TABLE,
+    INDEXER_REINDEX_MODE,
+    INDEXER_CONVERSION_WORKERS,
+    INDEXER_CONVERSION_INFLIGHT_MB,
+    INDEXER_CHUNK_WORKERS,
+    INDEXER_EMBED_WORKERS,
+    INDEXER_WRITE_WORKERS,
+    INDEXER_PIPELINE_QUEUE_SIZE,
+    INDEXER_CHUNK_MAX_TOKENS,
+    EMBEDDING_BATCH_LIMITS,
+    EMBEDDING_MODELS,
+    INDEXER_MANIFEST_PATH,
+    CONVERSION_CACHE_DIR,
+    CONVERSION_CACHE_MAX_MB,
+    SUPABASE_DB_URL,
+    BULK_WRITE_MAX_BYTES,
+    BULK_WRITE_CONCURRENCY,
+    BULK_WRITE_MAX_RETRIES,
+    CHUNK_GC_ENABLED,
 )
 
 load_dotenv()
 
+SUPPORTED_SUFFIXES = [
+    ".pdf",
+    ".docx",
+    ".pptx",
+    ".md",
+    ".txt",
+    ".csv",
+    ".xls",
+    ".xlsx",
+    ".doc",
+    ".ppt",
+    ".png",
+    ".jpg",
+    ".jpeg",
+]
 
-# --- Part 1: SharePoint Sync (Updated) ---
-class SharePointSync:
-    def __init__(self, download_dir):
-        self.tenant_id = os.getenv("OFFICE_365_TENANT_ID")
-        self.client_id = os.getenv("OFFICE_365_CLIENT_ID")
-        self.client_secret = os.getenv("OFFICE_365_CLIENT_SECRET")
-        self.host_name = os.getenv("OFFICE_365_SITE_HOSTNAME")
-        self.site_path = os.getenv("OFFICE_365_SITE_NAME")
-        self.doc_lib_name = os.getenv("OFFICE_365_DOCUMENT_LIBRARY_NAME")
-
-        self.download_dir = download_dir
-        self.state_file = Path("sync_state.json")
-        self.sync_state = {}
-
-        self.scopes = ["https://graph.microsoft.com/.default"]
-        self.headers = None
-
-        # Track updated files to trigger indexing later
-        self.updated_files = []
-
-        if self.state_file.exists():
-            with open(self.state_file, "r") as f:
-                self.sync_state = json.load(f)
-
-    def authenticate(self):
-        app = msal.ConfidentialClientApplication(
-            self.client_id,
-            authority=f"https://login.microsoftonline.com/{self.tenant_id}",
-            client_credential=self.client_secret,
-        )
-        result = app.acquire_token_for_client(scopes=self.scopes)
-        if "access_token" in result:
-            self.headers = {"Authorization": f'Bearer {result["access_token"]}'}
-        else:
-            raise Exception(f"Auth failed: {result.get('error_description')}")
 
-    def get_site_and_drive(self):
-        # 1. Get Site
-        site_url = (
-            f"https://graph.microsoft.com/v1.0/sites/{self.host_name}:{self.site_path}"
-        )
-        resp = requests.get(site_url, headers=self.headers)
-        resp.raise_for_status()
-        site_id = resp.json()["id"]
-
-        # 2. Get Drive
-        resp = requests.get(
-            f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives",
-            headers=self.headers,
-        )
-        drive_id = next(
-            (d["id"] for d in resp.json()["value"] if d["name"] == self.doc_lib_name),
-            None,
+# --- Part 1: SharePoint Sync (Updated) ---
+class SharePointSync(DriveSync):
+    def __init__(self, download_dir, mode=None):
+        super().__init__(
+            download_dir,
+            "sync_state.sqlite3",
+            mode,
+            legacy_state=("sync_state.json", "sync_delta.json"),
         )
 
-        if not drive_id:
-            raise Exception("Drive not found")
-        return site_id, drive_id
-
-    def process_folder(self, site_id, drive_id, folder_id="root", current_path=None):
-        if current_path is None:
-            current_path = self.download_dir
-
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{folder_id}/children"
-
-        while url:
-            resp = requests.get(url, headers=self.headers)
-            data = resp.json()
-
-            for item in data.get("value", []):
-                name = item["name"]
-                local_path = current_path / name
-
-                if "folder" in item:
-                    self.process_folder(site_id, drive_id, item["id"], local_path)
-                elif "file" in item:
-                    remote_mod = item["lastModifiedDateTime"]
-                    item_id = item["id"]
-
-                    # Check if download needed
-                    needs_sync = True
-                    if item_id in self.sync_state:
-                        saved_time = dateutil.parser.isoparse(self.sync_state[item_id])
-                        remote_time = dateutil.parser.isoparse(remote_mod)
-                        if remote_time <= saved_time and local_path.exists():
-                            needs_sync = False
-
-                    if needs_sync:
-                        self.download_file(
-                            item["@microsoft.graph.downloadUrl"], local_path
-                        )
-                        self.sync_state[item_id] = remote_mod
-                        self.updated_files.append(local_path)  # Mark for indexing
-
-            url = data.get("@odata.nextLink")
-
-    def download_file(self, url, path):
-        path.parent.mkdir(parents=True, exist_ok=True)
-        print(f"Downloading: {path}")
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(path, "wb") as f:
-                for chunk in r.iter_content(8192):
-                    f.write(chunk)
-
-    def run(self):
-        self.authenticate()
-        site_id, drive_id = self.get_site_and_drive()
-        print("Starting SharePoint Sync...")
-        self.process_folder(site_id, drive_id)
-
-        with open(self.state_file, "w") as f:
-            json.dump(self.sync_state, f, indent=4)
-
-        return self.updated_files
-
 
 # --- Part 2: Knowledge Base Indexer ---
 class KnowledgeBaseIndexer:
-    def __init__(self, root_dir):
+    def __init__(
+        self,
+        root_dir,
+        reindex_mode=INDEXER_REINDEX_MODE,
+        conversion_workers=INDEXER_CONVERSION_WORKERS,
+    ):
         self.root_dir = root_dir
         self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
         self.embedder = global_embedding_service_instance
         self.converter = DocumentConverter()
 
+        # Converted documents keyed by source content hash and converter
+        # options, so re-chunking/re-embedding skips Docling entirely.
+        self.conversion_cache = (
+            DiskCache(CONVERSION_CACHE_DIR, CONVERSION_CACHE_MAX_MB * 1024 * 1024)
+            if CONVERSION_CACHE_DIR
+            else None
+        )
+        self.conversion_options = f"docling={version('docling')}|default"
+
+        # Token-aware chunking: merges small adjacent items up to the chunk
+        # budget and keeps the heading path, using the embedding tokenizer.
+        max_input_tokens = EMBEDDING_BATCH_LIMITS.get(LLM_SERVICE, {}).get(
+            "max_input_tokens", INDEXER_CHUNK_MAX_TOKENS
+        )
+        self.chunker = HybridChunker(
+            tokenizer=OpenAITokenizer(
+                tokenizer=self.embedder.tokenizer,
+                max_tokens=min(INDEXER_CHUNK_MAX_TOKENS, max_input_tokens),
+            ),
+            merge_peers=True,
+        )
+
+        # Files indexed with a different model or chunk size are not "unchanged".
+        self.index_version = (
+            f"{EMBEDDING_MODELS.get(LLM_SERVICE)}|chunk_tokens={INDEXER_CHUNK_MAX_TOKENS}"
+        )
+        self.manifest = IndexManifest(INDEXER_MANIFEST_PATH, self.index_version)
+        self.last_run_stats = {}
+        # Files of the last run skipped for their type (nothing to index).
+        self.skipped_files = []
+
+        # "diff" only writes changed chunks, "replace" deletes and re-inserts
+        # every chunk of a modified file.
+        self.reindex_mode = reindex_mode
+
+        # More than one worker converts files in a process pool.
+        self.conversion_workers = conversion_workers
+        # Upper bound on the source bytes being converted at the same time,
+        # so several large PDFs are not parsed by every worker at once.
+        self.conversion_inflight_bytes = INDEXER_CONVERSION_INFLIGHT_MB * 1024 * 1024
+
         # Load schema/table config
         self.db_schema = SUPABASE_SCHEMA
         self.db_table = SUPABASE_TABLE
+        self.writer = BulkWriter(
+            self.supabase,
+            self.db_schema,
+            self.db_table,
+            max_batch_bytes=BULK_WRITE_MAX_BYTES,
+            concurrency=BULK_WRITE_CONCURRENCY,
+            max_retries=BULK_WRITE_MAX_RETRIES,
+            db_url=SUPABASE_DB_URL,
+        )
 
     def get_category_from_path(self, file_path):
         """Extracts the subfolder structure relative to root_dir."""
@@ -174,100 +170,394 @@ class KnowledgeBaseIndexer:
         except ValueError:
             return "External"
 
-    def index_file(self, file_path):
-        print(f"Processing with Docling: {file_path.name}")
-
-        try:
-            # 1. Convert
-            doc_result = self.converter.convert(file_path)
-            doc = doc_result.document
-
-            category = self.get_category_from_path(file_path)
-
-            # 2. Cleanup Old Entries
-            # IMPORTANT: We explicitly call .schema() before .table()
+    def get_chunk_page(self, chunk):
+        """First page the chunk was found on (1 for formats without pages)."""
+        for item in chunk.meta.doc_items:
+            for prov in getattr(item, "prov", None) or []:
+                return prov.page_no
+        return 1
+
+    def chunk_hash(self, content, metadata):
+        """Stable fingerprint of a chunk's text and metadata."""
+        raw = json.dumps({"content": content, "metadata": metadata}, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_stored_chunks(self, file_path):
+        """Returns {chunk_hash: [row ids]} for the rows already stored for a file."""
+        stored = {}
+        page_size = 1000
+        start = 0
+        while True:
+            response = (
+                self.supabase.schema(self.db_schema)
+                .table(self.db_table)
+                .select("id, chunk_hash:metadata->>chunk_hash")
+                .eq("metadata->>filepath", str(file_path))
+                .range(start, start + page_size - 1)
+                .execute()
+            )
+            for row in response.data:
+                stored.setdefault(row["chunk_hash"], []).append(row["id"])
+            if len(response.data) < page_size:
+                return stored
+            start += page_size
+
+    def delete_chunks(self, row_ids):
+        # Keep the id list short enough for the PostgREST query string.
+        batch_size = 200
+        for i in range(0, len(row_ids), batch_size):
             (
                 self.supabase.schema(self.db_schema)
                 .table(self.db_table)
                 .delete()
-                .eq("metadata->>filepath", str(file_path))
+                .in_("id", row_ids[i : i + batch_size])
                 .execute()
             )
 
-            chunks_to_insert = []
+    def index_file(self, file_path):
+        job = self.convert_file(file_path)
+        if job is not None:
+            self.index_document(file_path, job["doc"], job["content_hash"])
+
+    def index_document(self, file_path, doc, content_hash=None):
+        """Chunks, embeds and stores an already converted document."""
+        job = {"file_path": file_path, "doc": doc, "content_hash": content_hash}
+        for step in (self.chunk_document, self.embed_chunks, self.write_chunks):
+            job = step(job)
+            if job is None:
+                return
+
+    # --- Pipeline stages ---
+    # Each stage takes and returns a job dict; returning None drops the file.
+
+    def conversion_key(self, content_hash):
+        raw = f"{content_hash}|{self.conversion_options}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_cached_conversion(self, content_hash):
+        if self.conversion_cache is None:
+            return None
+        data = self.conversion_cache.get(self.conversion_key(content_hash))
+        return DoclingDocument.model_validate(data) if data is not None else None
+
+    def store_conversion(self, content_hash, doc):
+        if self.conversion_cache is not None:
+            self.conversion_cache.put(
+                self.conversion_key(content_hash), doc.export_to_dict()
+            )
 
-            for item in doc.texts:
-                text_content = item.text.strip()
-                if not text_content or len(text_content) < 50:
-                    continue
+    def load_without_converter(self, file_path, content_hash):
+        """Returns the document if it can be had without Docling conversion.
+
+        Plain-text formats are read by the fast-path loaders; other formats
+        come from the conversion cache. Returns None otherwise.
+        """
+        loader = FAST_PATH_LOADERS.get(file_path.suffix.lower())
+        if loader is not None:
+            return loader(file_path)
+        return self.get_cached_conversion(content_hash)
+
+    def convert_file(self, file_path):
+        print(f"Processing: {file_path.name}")
+        try:
+            content_hash = file_sha256(file_path)
+            doc = self.load_without_converter(file_path, content_hash)
+            if doc is None:
+                # 1. Convert
+                doc = self.converter.convert(file_path).document
+                self.store_conversion(content_hash, doc)
+        except Exception as e:
+            print(f"Failed to index {file_path.name}: {e}")
+            return None
+        return {"file_path": file_path, "doc": doc, "content_hash": content_hash}
+
+    def collect_conversion(self, item):
+        """Convert stage for pool mode: unwraps a finished worker future."""
+        file_path, content_hash, future, from_cache = item
+        try:
+            doc = future.result()
+            if not from_cache:
+                self.store_conversion(content_hash, doc)
+        except Exception as e:
+            print(f"Failed to index {file_path.name}: {e}")
+            return None
+        return {"file_path": file_path, "doc": doc, "content_hash": content_hash}
 
-                # 3. Embed
-                vector = self.embedder.get_embedding(text_content)
-                if not vector:
+    def chunk_document(self, job):
+        file_path = job["file_path"]
+        try:
+            category = self.get_category_from_path(file_path)
+
+            chunks = []
+            for chunk in self.chunker.chunk(dl_doc=job["doc"]):
+                # Embed the chunk together with its heading path for context.
+                text_content = self.chunker.contextualize(chunk=chunk).strip()
+                if not text_content:
                     continue
 
-                # 4. Prepare Payload
-                payload = {
-                    "content": text_content,
-                    "metadata": {
-                        "filepath": str(file_path),
-                        "filename": file_path.name,
-                        "category": category,
-                        "page_no": getattr(item, "page_no", 1),
-                    },
-                    "embedding": vector,
+                metadata = {
+                    "filepath": str(file_path),
+                    "filename": file_path.name,
+                    "category": category,
+                    "page_no": self.get_chunk_page(chunk),
+                    "headings": chunk.meta.headings or [],
                 }
-                chunks_to_insert.append(payload)
-
-            # 5. Batch Insert
-            if chunks_to_insert:
-                batch_size = 10
-                for i in range(0, len(chunks_to_insert), batch_size):
-                    batch = chunks_to_insert[i : i + batch_size]
-
-                    # IMPORTANT: Apply Schema and Table here as well
-                    (
-                        self.supabase.schema(self.db_schema)
-                        .table(self.db_table)
-                        .insert(batch)
-                        .execute()
-                    )
-
-                print(
-                    f"Indexed {len(chunks_to_insert)} chunks for {file_path.name} in schema '{self.db_schema}'"
-                )
+                metadata["chunk_hash"] = self.chunk_hash(text_content, metadata)
+                chunks.append({"content": text_content, "metadata": metadata})
+
+            # 2. Work out which chunks actually changed
+            if self.reindex_mode == "diff":
+                stored = self.get_stored_chunks(file_path)
+                new_chunks = []
+                for chunk in chunks:
+                    ids = stored.get(chunk["metadata"]["chunk_hash"])
+                    if ids:
+                        ids.pop()  # Unchanged: keep the stored row
+                    else:
+                        new_chunks.append(chunk)
+                stale_ids = [row_id for ids in stored.values() for row_id in ids]
             else:
-                print(f"No readable text found in {file_path.name}")
+                new_chunks = chunks
+                stale_ids = []
+        except Exception as e:
+            print(f"Failed to index {file_path.name}: {e}")
+            return None
+
+        # The converted document is no longer needed; free it before queueing.
+        return {
+            "file_path": file_path,
+            "content_hash": job.get("content_hash"),
+            "chunks": chunks,
+            "new_chunks": new_chunks,
+            "stale_ids": stale_ids,
+        }
 
+    def embed_chunks(self, job):
+        try:
+            # 3. Embed (batched, results come back in input order)
+            vectors = self.embedder.get_embeddings(
+                [c["content"] for c in job["new_chunks"]]
+            )
+        except Exception as e:
+            print(f"Failed to index {job['file_path'].name}: {e}")
+            return None
+
+        # 4. Prepare Payload
+        job["rows"] = [
+            {**chunk, "embedding": vector}
+            for chunk, vector in zip(job["new_chunks"], vectors)
+            if vector
+        ]
+        return job
+
+    def write_chunks(self, job):
+        file_path = job["file_path"]
+        chunks, new_chunks = job["chunks"], job["new_chunks"]
+        chunks_to_insert, stale_ids = job["rows"], job["stale_ids"]
+        try:
+            if self.reindex_mode != "diff":
+                # Cleanup Old Entries
+                # IMPORTANT: We explicitly call .schema() before .table()
+                (
+                    self.supabase.schema(self.db_schema)
+                    .table(self.db_table)
+                    .delete()
+                    .eq("metadata->>filepath", str(file_path))
+                    .execute()
+                )
+
+            # 5. Batch Insert, then drop vanished chunks. Inserting first means
+            # the document stays searchable during re-indexing.
+            self.writer.write(chunks_to_insert)
+            self.delete_chunks(stale_ids)
         except Exception as e:
             print(f"Failed to index {file_path.name}: {e}")
+            return None
 
-    def run_indexer(self, files_to_process=None):
-        if files_to_process:
+        if not chunks:
+            print(f"No readable text found in {file_path.name}")
+        elif self.reindex_mode == "diff":
+            print(
+                f"Indexed {file_path.name} in schema '{self.db_schema}': "
+                f"{len(chunks_to_insert)} inserted, {len(stale_ids)} removed, "
+                f"{len(chunks) - len(new_chunks)} unchanged"
+            )
+        else:
+            print(
+                f"Indexed {len(chunks_to_insert)} chunks for {file_path.name} in schema '{self.db_schema}'"
+            )
+        self.manifest.record(file_path, job.get("content_hash"))
+        return {
+            "file_path": file_path,
+            "inserted": len(chunks_to_insert),
+            "removed": len(stale_ids),
+        }
+
+    def convert_in_pool(self, files):
+        """Converts files in a process pool, yielding conversions as they finish.
+
+        Yields (file_path, content_hash, future, from_cache); plain-text
+        files and cached conversions are yielded right away without using
+        a worker.
+
+        Files are submitted largest first so big PDFs start early and end up
+        on different workers. A new file is only started while the source
+        bytes in flight stay under the memory budget (one file always runs).
+        `files` may also be an iterator (e.g. files still downloading); it is
+        then read only when a worker is free.
+        """
+        if isinstance(files, list):
+            pending = sorted(files, key=lambda f: f.stat().st_size, reverse=True)
+            source = None
+        else:
+            pending = []
+            source = iter(files)
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.conversion_workers)
+        in_flight = {}
+        in_flight_bytes = 0
+
+        with ProcessPoolExecutor(
+            max_workers=self.conversion_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=conversion_worker.init_worker,
+            initargs=(threads_per_worker,),
+        ) as pool:
+            while True:
+                if source is not None and len(pending) + len(in_flight) < self.conversion_workers:
+                    file_path = next(source, None)
+                    if file_path is None:
+                        source = None
+                    else:
+                        pending.append(file_path)
+                        continue
+                if not (pending or in_flight):
+                    break
+
+                i = 0
+                while len(in_flight) < self.conversion_workers and i < len(pending):
+                    size = pending[i].stat().st_size
+                    if in_flight and in_flight_bytes + size > self.conversion_inflight_bytes:
+                        i += 1
+                        continue
+                    file_path = pending.pop(i)
+                    print(f"Processing: {file_path.name}")
+                    try:
+                        content_hash = file_sha256(file_path)
+                        doc = self.load_without_converter(file_path, content_hash)
+                    except Exception as e:
+                        print(f"Failed to index {file_path.name}: {e}")
+                        continue
+
+                    if doc is not None:
+                        # Plain text or cache hit: no worker needed.
+                        future = Future()
+                        future.set_result(doc)
+                        yield file_path, content_hash, future, True
+                        continue
+
+                    future = pool.submit(conversion_worker.convert, file_path)
+                    in_flight[future] = (file_path, content_hash, size)
+                    in_flight_bytes += size
+
+                if not in_flight:
+                    continue
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path, content_hash, size = in_flight.pop(future)
+                    in_flight_bytes -= size
+                    yield file_path, content_hash, future, False
+
+    def run_indexer(self, files_to_process=None, force=False):
+        """Indexes the given files, or every supported file under root_dir.
+
+        A full scan skips files whose manifest fingerprint is unchanged
+        unless `force` is set. `files_to_process` can be a generator such as
+        SharePointSync.iter_sync(), in which case files are indexed as soon
+        as they are yielded.
+        """
+        streaming = files_to_process is not None and not isinstance(
+            files_to_process, (list, tuple)
+        )
+        # Synced files Docling can't read would fail conversion on every run.
+        self.skipped_files = []
+
+        def supported(f):
+            if f.suffix.lower() in SUPPORTED_SUFFIXES:
+                return True
+            print(f"Skipping {f.name}: unsupported file type.")
+            self.skipped_files.append(f)
+            return False
+
+        if streaming:
+            print(f"Indexing files as they sync to {self.db_schema}.{self.db_table}...")
+            files = []
+
+            def source_files():
+                for f in files_to_process:
+                    if supported(f):
+                        files.append(f)
+                        yield f
+
+            files_iter = source_files()
+        elif files_to_process:
             print(
                 f"Indexing {len(files_to_process)} new/modified files to {self.db_schema}.{self.db_table}..."
             )
-            for f in files_to_process:
-                self.index_file(f)
+            files = [f for f in files_to_process if supported(f)]
         else:
             print(f"Full scan indexing to {self.db_schema}.{self.db_table}...")
+            files = []
+            skipped = 0
             for f in self.root_dir.rglob("*"):
-                if f.is_file() and f.suffix.lower() in [
-                    ".pdf",
-                    ".docx",
-                    ".pptx",
-                    ".md",
-                    ".txt",
-                    ".csv",
-                    ".xls",
-                    ".xlsx",
-                    ".doc",
-                    ".ppt",
-                    ".png",
-                    ".jpg",
-                    ".jpeg",
-                ]:
-                    self.index_file(f)
+                if not f.is_file() or f.suffix.lower() not in SUPPORTED_SUFFIXES:
+                    continue
+                if not force and self.manifest.is_unchanged(f):
+                    skipped += 1
+                    continue
+                files.append(f)
+            print(f"Skipping {skipped} unchanged files, {len(files)} to index.")
+
+        # Conversion (CPU), embedding (network) and writes (DB) overlap in
+        # a bounded pipeline instead of running back to back per file.
+        if not streaming:
+            files_iter = files
+        if self.conversion_workers > 1 and (streaming or len(files) > 1):
+            source = self.convert_in_pool(files_iter)
+            convert = Stage("convert", self.collect_conversion)
+        else:
+            source = files_iter
+            convert = Stage("convert", self.convert_file)
+
+        pipeline = Pipeline(
+            [
+                convert,
+                Stage("chunk", self.chunk_document, INDEXER_CHUNK_WORKERS),
+                Stage("embed", self.embed_chunks, INDEXER_EMBED_WORKERS),
+                Stage("write", self.write_chunks, INDEXER_WRITE_WORKERS),
+            ],
+            queue_size=INDEXER_PIPELINE_QUEUE_SIZE,
+        )
+        try:
+            indexed = pipeline.run(source)
+        finally:
+            self.manifest.save()
+            self.last_run_stats = pipeline.stats()
+        print(f"Indexed {len(indexed)}/{len(files)} files.")
+
+        if self.embedder.cache is not None:
+            stats = self.embedder.cache.stats()
+            print(
+                f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries"
+            )
+        print(f"Embedding requests: {self.embedder.scheduler.metrics()}")
+        if self.conversion_cache is not None:
+            stats = self.conversion_cache.stats()
+            print(
+                f"Conversion cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries ({stats['bytes'] // (1024 * 1024)} MB)"
+            )
+        return indexed
 
 
 # --- Part 3: Interactive Chat Agent (New) ---
@@ -432,20 +722,41 @@ class ChatAgent:
 
 
 # --- Scheduled Indexing Execution Flow ---
-def scheduled_indexing():
+def scheduled_indexing(wait=False):
+    """Syncs and indexes the document library.
+
+    Holds the library's SyncLock for the whole run. When another process
+    (the job runner or the change-notification receiver) is already
+    syncing, the run is skipped, or waits for it when `wait` is set.
+    """
     DOWNLOAD_DIR = Path("./downloads")
 
-    # 1. Run SharePoint Sync
-    syncer = SharePointSync(DOWNLOAD_DIR)
-    updated_files = syncer.run()
+    lock = SyncLock("documents")
+    if not lock.acquire(wait):
+        print("Skipping document sync: another process is syncing the library.")
+        return 0
+    try:
+        # 1. Run SharePoint Sync and 2. the Indexer together: each file is
+        # indexed as soon as its download finishes.
+        syncer = SharePointSync(DOWNLOAD_DIR)
+        indexer = KnowledgeBaseIndexer(DOWNLOAD_DIR)
+        indexed = indexer.run_indexer(syncer.iter_sync())
+        # Skipped files count as done, so they aren't offered again each run.
+        syncer.mark_indexed(
+            [result["file_path"] for result in indexed] + indexer.skipped_files
+        )
 
-    # 2. Run Indexer
-    indexer = KnowledgeBaseIndexer(DOWNLOAD_DIR)
+        if not syncer.updated_files:
+            print("No new files from SharePoint.")
 
-    if updated_files:
-        indexer.run_indexer(updated_files)
-    else:
-        print("No new files from SharePoint.")
+        # 3. Drop the chunks of files that were deleted or moved.
+        if CHUNK_GC_ENABLED:
+            collect_orphans(
+                syncer, indexer.supabase, indexer.db_schema, indexer.db_table, indexer.manifest
+            )
+        return len(indexed)
+    finally:
+        lock.release()
 
 
 # --- Main Execution Flow ---
@@ -470,4 +781,5 @@ if __name__ == "__main__":
             "Do you want to run a full re-indexing of existing local files? (y/n): "
         )
         if user_input.lower() == "y":
-            indexer.run_indexer()
+            # Pass --force to re-index files even if they are unchanged.
+            indexer.run_indexer(force="--force" in sys.argv)
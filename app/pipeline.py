@@ -0,0 +1,142 @@
+import os
+import queue
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+_DONE = object()
+
+
+def current_rss_bytes():
+    """Resident set size of this process (falls back to the peak RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        # ru_maxrss is in KB on Linux and bytes on macOS; close enough here.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# --- Threaded Stage Pipeline ---
+class Stage:
+    """One pipeline step: `func` maps an item to the next item.
+
+    Returning None drops the item; like an exception, it counts as failed
+    (the indexer's stages return None after logging their own errors).
+    """
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.peak_rss = 0
+        self.lock = threading.Lock()
+
+    def record(self, elapsed, ok):
+        rss = current_rss_bytes()
+        with self.lock:
+            self.busy_seconds += elapsed
+            self.peak_rss = max(self.peak_rss, rss)
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+
+
+class Pipeline:
+    """Runs items through stages connected by bounded queues.
+
+    Every stage has its own worker threads. When a stage falls behind its
+    input queue fills up and the stage before it blocks on `put`, so the
+    slowest stage sets the pace without unbounded buffering in between.
+    """
+
+    def __init__(self, stages, queue_size=8):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items):
+        """Feeds `items` from the calling thread and blocks until all stages drain.
+
+        Returns the items that came out of the last stage.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = []
+        results_lock = threading.Lock()
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            stage_threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(stage, inbox, outbox, results, results_lock),
+                    name=f"pipeline-{stage.name}-{n}",
+                    daemon=True,
+                )
+                for n in range(stage.workers)
+            ]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            # Shut stages down in order so each one drains before the next
+            # is told there is no more input.
+            for index, stage_threads in enumerate(threads):
+                for _ in stage_threads:
+                    queues[index].put(_DONE)
+                for thread in stage_threads:
+                    thread.join()
+
+        return results
+
+    def _work(self, stage, inbox, outbox, results, results_lock):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+
+            started = time.perf_counter()
+            try:
+                output = stage.func(item)
+            except Exception as e:
+                stage.record(time.perf_counter() - started, ok=False)
+                print(f"Pipeline stage '{stage.name}' failed: {e}")
+                continue
+            stage.record(time.perf_counter() - started, ok=output is not None)
+
+            if output is None:
+                continue
+            if outbox is not None:
+                outbox.put(output)
+            else:
+                with results_lock:
+                    results.append(output)
+
+    def stats(self):
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "processed": stage.processed,
+                "failed": stage.failed,
+                "busy_seconds": round(stage.busy_seconds, 3),
+                "peak_rss_mb": round(stage.peak_rss / (1024 * 1024), 1),
+            }
+            for stage in self.stages
+        }
@@ -0,0 +1,214 @@
+import random
+import re
+import threading
+import time
+
+
+class RetryableError(Exception):
+    """Raised by a scheduled call to request a retry (optionally after a delay)."""
+
+    def __init__(self, error, rate_limited=False, retry_after=None):
+        super().__init__(str(error))
+        self.error = error
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+
+
+class RequestDroppedError(Exception):
+    """A scheduled call still failed after all retries."""
+
+
+def parse_duration(value):
+    """Parses rate-limit reset values like "1s", "6m0s", "20ms" or "2.5"."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    return sum(float(n) * units[u] for n, u in parts) if parts else None
+
+
+# --- Token Bucket ---
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute, up to one minute of burst."""
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.available = float(rate_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(
+            self.rate_per_minute,
+            self.available + (now - self.updated) * self.rate_per_minute / 60,
+        )
+        self.updated = now
+
+    def acquire(self, amount):
+        amount = min(amount, self.rate_per_minute)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) * 60 / self.rate_per_minute
+            time.sleep(wait)
+
+    def set_rate(self, rate_per_minute):
+        with self.lock:
+            self._refill()
+            self.rate_per_minute = rate_per_minute
+            self.available = min(self.available, rate_per_minute)
+
+    def drain_for(self, seconds):
+        """Empties the bucket so nothing is sent for roughly `seconds`."""
+        with self.lock:
+            self._refill()
+            self.available = -seconds * self.rate_per_minute / 60
+
+
+# --- Rate-Limited Call Scheduler ---
+class RateLimitedScheduler:
+    """Client-side pacing for provider calls.
+
+    Each call first takes a concurrency slot, then a request from the RPM
+    bucket and its tokens from the TPM bucket. The concurrency limit adapts
+    AIMD-style: it halves on a 429 and grows back by one after a run of
+    successes. Bucket rates follow the provider's rate-limit headers when
+    they are reported. Calls raising RetryableError are retried with
+    jittered exponential backoff (or the provider's Retry-After). After
+    `max_retries` the call is counted as dropped and RequestDroppedError is
+    raised, so nothing fails silently.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute,
+        tokens_per_minute,
+        max_concurrency=8,
+        max_retries=8,
+        max_backoff=60,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+
+        self.condition = threading.Condition()
+        self.successes_since_throttle = 0
+        self.counters = {
+            "queued": 0,
+            "in_flight": 0,
+            "completed": 0,
+            "retries": 0,
+            "throttled": 0,
+            "dropped": 0,
+        }
+
+    def _count(self, name, delta=1):
+        with self.condition:
+            self.counters[name] += delta
+
+    def _acquire_slot(self):
+        with self.condition:
+            self.counters["queued"] += 1
+            while self.counters["in_flight"] >= self.concurrency_limit:
+                self.condition.wait()
+            self.counters["queued"] -= 1
+            self.counters["in_flight"] += 1
+
+    def _release_slot(self):
+        with self.condition:
+            self.counters["in_flight"] -= 1
+            self.condition.notify_all()
+
+    def _on_success(self):
+        with self.condition:
+            self.counters["completed"] += 1
+            self.successes_since_throttle += 1
+            if (
+                self.concurrency_limit < self.max_concurrency
+                and self.successes_since_throttle >= 2 * self.concurrency_limit
+            ):
+                self.concurrency_limit += 1
+                self.successes_since_throttle = 0
+                self.condition.notify_all()
+
+    def _on_throttle(self):
+        with self.condition:
+            self.counters["throttled"] += 1
+            self.concurrency_limit = max(1, self.concurrency_limit // 2)
+            self.successes_since_throttle = 0
+
+    def run(self, func, tokens=1):
+        """Calls `func()` under the rate limits and returns its result.
+
+        The concurrency slot is only held while a request is being sent;
+        it is released during the backoff and taken again for the retry.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire_slot()
+            try:
+                self.requests.acquire(1)
+                self.tokens.acquire(tokens)
+                result = func()
+            except RetryableError as e:
+                error = e
+            except Exception:
+                self._count("dropped")
+                raise
+            else:
+                self._on_success()
+                return result
+            finally:
+                self._release_slot()
+
+            if error.rate_limited:
+                self._on_throttle()
+            if attempt == self.max_retries:
+                self._count("dropped")
+                raise RequestDroppedError(
+                    f"Giving up after {attempt + 1} attempts: {error.error}"
+                ) from error.error
+
+            self._count("retries")
+            backoff = min(self.max_backoff, 2**attempt)
+            time.sleep(error.retry_after or backoff * random.uniform(0.5, 1.0))
+
+    def observe_headers(self, headers):
+        """Adopts OpenAI-style x-ratelimit-* headers from a response."""
+        limit_requests = headers.get("x-ratelimit-limit-requests")
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        if limit_requests and int(limit_requests) != self.requests.rate_per_minute:
+            self.requests.set_rate(int(limit_requests))
+        if limit_tokens and int(limit_tokens) != self.tokens.rate_per_minute:
+            self.tokens.set_rate(int(limit_tokens))
+
+        # Nearly out of quota: hold new calls until the window resets.
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        if remaining_requests is not None and int(remaining_requests) <= 1:
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self.requests.drain_for(reset)
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None and int(remaining_tokens) <= 0:
+            reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            if reset:
+                self.tokens.drain_for(reset)
+
+    def metrics(self):
+        with self.condition:
+            return {
+                **self.counters,
+                "concurrency_limit": self.concurrency_limit,
+                "requests_per_minute": self.requests.rate_per_minute,
+                "tokens_per_minute": self.tokens.rate_per_minute,
+            }
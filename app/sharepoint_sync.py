@@ -0,0 +1,464 @@
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import as_completed, wait
+from itertools import chain
+from pathlib import Path
+
+from config import (
+    SHAREPOINT_SYNC_MODE,
+    SHAREPOINT_DOWNLOAD_WORKERS,
+    SHAREPOINT_DOWNLOAD_CHUNK_KB,
+    SHAREPOINT_DOWNLOAD_RESUME_MB,
+)
+from downloader import Downloader
+from graph_client import GRAPH_URL, get_graph_client
+from sync_store import SyncStore, parse_timestamp
+
+# Graph accepts at most 20 requests per JSON batch.
+GRAPH_BATCH_SIZE = 20
+# A batch (or a folder listing in it) still throttled after this many
+# attempts fails the sync instead of waiting forever.
+GRAPH_THROTTLE_RETRIES = 8
+# @microsoft.graph.downloadUrl links expire after about an hour.
+DOWNLOAD_URL_MAX_AGE = 45 * 60
+
+
+# --- SharePoint Drive Sync ---
+class DriveSync:
+    """Mirrors a SharePoint document library into `download_dir`.
+
+    Two modes:
+      - "delta": walks the drive's /delta feed and stores the returned
+        delta link, so the next run only receives what changed since (a
+        run with no changes costs a single request). Deleted, renamed and
+        moved items are reported in `deleted_files`.
+      - "crawl": lists every folder (breadth-first, batched) and compares
+        modification times against the sync state. Files a complete crawl
+        no longer finds are reported in `deleted_files` too.
+
+    Downloads run concurrently while the library is still being listed.
+    `iter_sync()` yields each file as soon as its download finishes, so
+    indexing can start before the sync is done; `run()` waits for all of
+    them and returns the list.
+
+    State lives in a SyncStore (SQLite) and is committed per file, and the
+    delta walk's position is saved after every page, so an interrupted run
+    picks up where it stopped: it continues the delta walk, retries
+    unfinished downloads and re-yields files that were downloaded but never
+    indexed.
+
+    Subclasses set the env vars, state paths and `should_sync` filter.
+    """
+
+    site_env = "OFFICE_365_SITE_NAME"
+    library_env = "OFFICE_365_DOCUMENT_LIBRARY_NAME"
+
+    def __init__(self, download_dir, store_path, mode=None, legacy_state=(), graph=None):
+        # Tokens and site/drive ids are shared with the other sync job.
+        self.graph = graph or get_graph_client()
+        self.host_name = os.getenv("OFFICE_365_SITE_HOSTNAME")
+        self.site_path = os.getenv(self.site_env)
+        self.doc_lib_name = os.getenv(self.library_env)
+        self.mode = (mode or SHAREPOINT_SYNC_MODE).lower()
+
+        self.download_dir = Path(download_dir)
+
+        # Every known file and folder with its path relative to
+        # download_dir. Delta responses don't carry parent paths, so paths
+        # are rebuilt from the stored folders.
+        self.store = SyncStore(store_path)
+        if legacy_state and self.store.is_empty():
+            migrated = self.store.import_json(*legacy_state)
+            if migrated:
+                print(f"Migrated {migrated} items from {legacy_state[0]}.")
+
+        # Track updated / removed files to trigger indexing later
+        self.updated_files = []
+        self.deleted_files = []
+
+        self.downloader = Downloader(
+            workers=SHAREPOINT_DOWNLOAD_WORKERS,
+            chunk_size=SHAREPOINT_DOWNLOAD_CHUNK_KB * 1024,
+            resume_min_bytes=SHAREPOINT_DOWNLOAD_RESUME_MB * 1024 * 1024,
+        )
+        # In-flight downloads: future -> item id
+        self.pending = {}
+        self.pending_items = {}
+
+    def site_ref(self):
+        return f"{self.host_name}:{self.site_path}"
+
+    def get_site_and_drive(self):
+        return self.graph.resolve_drive(self.site_ref(), self.doc_lib_name)
+
+    def should_sync(self, name):
+        return True
+
+    def local_path(self, relative_path):
+        return self.download_dir.joinpath(*relative_path.split("/"))
+
+    def needs_download(self, item_id, remote_mod, local_path):
+        row = self.store.get(item_id)
+        if row is None or row[3] is None or not local_path.exists():
+            return True
+        return parse_timestamp(remote_mod) > row[2]
+
+    def wait_for_item(self, item_id):
+        future = self.pending_items.get(item_id)
+        if future is not None:
+            wait([future])
+
+    def sync_file(self, site_id, drive_id, item, relative_path):
+        """Starts a download of a file item if it is new or changed."""
+        item_id = item["id"]
+        remote_mod = item["lastModifiedDateTime"]
+        local_path = self.local_path(relative_path)
+        # The same item can show up twice in one delta feed.
+        self.wait_for_item(item_id)
+
+        old_path = self.store.path_of(item_id, "file")
+        moved = bool(old_path) and old_path != relative_path
+        if moved:
+            # Renamed or moved: keep the local copy but re-key it.
+            old_local = self.local_path(old_path)
+            print(f"Moved in SharePoint: {old_local} -> {local_path}")
+            self.deleted_files.append(old_local)
+            if old_local.exists() and not local_path.exists():
+                local_path.parent.mkdir(parents=True, exist_ok=True)
+                old_local.rename(local_path)
+
+        if self.needs_download(item_id, remote_mod, local_path):
+            self.store.start_download(item_id, relative_path, remote_mod)
+            self.start_download(
+                site_id, drive_id, item_id, relative_path,
+                item.get("@microsoft.graph.downloadUrl"),
+            )
+        elif old_path != relative_path:
+            # Moved, or migrated from the old JSON state without a path.
+            self.store.set_path(item_id, "file", relative_path)
+            if moved:
+                self.updated_files.append(local_path)
+
+    def start_download(self, site_id, drive_id, item_id, relative_path, url=None):
+        local_path = self.local_path(relative_path)
+        content_url = f"{GRAPH_URL}/sites/{site_id}/drives/{drive_id}/items/{item_id}/content"
+        listed_at = time.monotonic()
+
+        def source(expired):
+            # Resolved when the transfer starts. The pre-authenticated
+            # downloadUrl is only good for about an hour; after that, or
+            # once it was refused, go through /content with a current token.
+            if url and not expired and time.monotonic() - listed_at < DOWNLOAD_URL_MAX_AGE:
+                return url, None
+            return content_url, self.graph.auth_headers(force_refresh=expired and not url)
+
+        print(f"Downloading: {local_path}")
+        future = self.downloader.submit(source, local_path)
+        self.pending[future] = item_id
+        self.pending_items[item_id] = future
+
+    def resume_downloads(self, site_id, drive_id):
+        """Re-fetches files whose download did not finish in an earlier run."""
+        for item_id, relative_path in self.store.incomplete_downloads():
+            if item_id not in self.pending_items:
+                self.start_download(site_id, drive_id, item_id, relative_path)
+
+    def remove_file(self, item_id):
+        self.wait_for_item(item_id)
+        relative_path = self.store.path_of(item_id, "file")
+        self.store.forget(item_id)
+        if not relative_path:
+            return
+        local_path = self.local_path(relative_path)
+        print(f"Removed in SharePoint: {local_path}")
+        self.deleted_files.append(local_path)
+        local_path.unlink(missing_ok=True)
+
+    def remove_folder(self, item_id):
+        folder_path = self.store.path_of(item_id, "folder")
+        self.store.forget(item_id)
+        if not folder_path:
+            return
+        for child_id, _ in self.store.under(folder_path, "file"):
+            self.remove_file(child_id)
+        for child_id, _ in self.store.under(folder_path, "folder"):
+            self.store.forget(child_id)
+        shutil.rmtree(self.local_path(folder_path), ignore_errors=True)
+
+    # --- Crawl mode ---
+    def process_folder(self, site_id, drive_id, folder_id="root", current_path=""):
+        """Lists the tree breadth-first, up to 20 folder listings per $batch call.
+
+        Each level's folders (and next pages of large folders) are queued
+        and sent together through Graph JSON batching. A throttled
+        sub-request is re-queued and only retried after its own
+        Retry-After; the rest of the batch is processed normally. A listing
+        throttled GRAPH_THROTTLE_RETRIES times raises.
+        """
+        # Queue of (relative url, folder path, not before, throttled count)
+        queue = deque(
+            [(f"/sites/{site_id}/drives/{drive_id}/items/{folder_id}/children", current_path, 0, 0)]
+        )
+        batches = listed = failed = 0
+
+        while queue:
+            now = time.monotonic()
+            ready = [entry for entry in queue if entry[2] <= now][:GRAPH_BATCH_SIZE]
+            if not ready:
+                time.sleep(min(entry[2] for entry in queue) - now)
+                continue
+            for entry in ready:
+                queue.remove(entry)
+
+            responses = self.send_batch([url for url, _, _, _ in ready])
+            batches += 1
+
+            for (url, path, _, throttled), response in zip(ready, responses):
+                status = response.get("status", 500)
+                if status in (429, 503, 504):
+                    if throttled + 1 >= GRAPH_THROTTLE_RETRIES:
+                        raise Exception(
+                            f"Listing {path or '/'} still throttled (HTTP {status}) "
+                            f"after {GRAPH_THROTTLE_RETRIES} attempts"
+                        )
+                    retry_after = float(response.get("headers", {}).get("Retry-After", 5))
+                    queue.append((url, path, time.monotonic() + retry_after, throttled + 1))
+                    continue
+                if status >= 400:
+                    print(f"Listing {path or '/'} failed: HTTP {status}")
+                    failed += 1
+                    continue
+
+                listed += 1
+                data = response.get("body", {})
+                for item in data.get("value", []):
+                    relative_path = f"{path}/{item['name']}".lstrip("/")
+                    self.seen.add(item["id"])
+
+                    if "folder" in item:
+                        self.store.set_path(item["id"], "folder", relative_path)
+                        queue.append(
+                            (
+                                f"/sites/{site_id}/drives/{drive_id}/items/{item['id']}/children",
+                                relative_path,
+                                0,
+                                0,
+                            )
+                        )
+                    elif "file" in item and self.should_sync(item["name"]):
+                        self.sync_file(site_id, drive_id, item, relative_path)
+
+                next_link = data.get("@odata.nextLink")
+                if next_link:
+                    queue.append((next_link.removeprefix(GRAPH_URL), path, 0, 0))
+
+        print(f"Crawl listed {listed} pages in {batches} batch requests.")
+        # Only a complete crawl of the whole library shows what was deleted.
+        if folder_id == "root" and not failed:
+            self.remove_unseen()
+
+    def remove_unseen(self):
+        """Drops every tracked item a complete listing did not return."""
+        for item_id in self.store.item_ids("file"):
+            if item_id not in self.seen:
+                self.remove_file(item_id)
+        for item_id in self.store.item_ids("folder"):
+            if item_id not in self.seen:
+                self.store.forget(item_id)
+
+    def send_batch(self, urls):
+        """Sends GET requests through /$batch; returns responses in request order."""
+        payload = {
+            "requests": [
+                {"id": str(i), "method": "GET", "url": url} for i, url in enumerate(urls)
+            ]
+        }
+        for attempt in range(1, GRAPH_THROTTLE_RETRIES + 1):
+            resp = self.graph.post("/$batch", json=payload)
+            if resp.status_code not in (429, 503, 504):
+                resp.raise_for_status()
+                break
+            if attempt == GRAPH_THROTTLE_RETRIES:
+                raise Exception(
+                    f"$batch still throttled (HTTP {resp.status_code}) "
+                    f"after {GRAPH_THROTTLE_RETRIES} attempts"
+                )
+            time.sleep(float(resp.headers.get("Retry-After", 5)))
+
+        by_id = {r["id"]: r for r in resp.json().get("responses", [])}
+        return [by_id.get(str(i), {"status": 500}) for i in range(len(urls))]
+
+    # --- Delta mode ---
+    def process_delta(self, site_id, drive_id):
+        # An unfinished walk continues from its last page; otherwise start
+        # from the saved delta link, or enumerate everything.
+        cursor = self.store.get_value("delta_cursor")
+        delta_link = self.store.get_value("delta_link")
+        full_scan = self.store.get_value("delta_full_scan") == "1" or (
+            cursor is None and delta_link is None
+        )
+        if full_scan:
+            self.store.set_value("delta_full_scan", "1")
+        url = cursor or delta_link or f"{GRAPH_URL}/sites/{site_id}/drives/{drive_id}/root/delta"
+
+        while url:
+            resp = self.graph.get(url)
+            if resp.status_code == 410 and (cursor or delta_link):
+                # The delta link expired: start over with a full enumeration.
+                print("Delta link expired; resyncing the whole library.")
+                for key in ("delta_cursor", "delta_link"):
+                    self.store.set_value(key, None)
+                return self.process_delta(site_id, drive_id)
+            resp.raise_for_status()
+            data = resp.json()
+
+            for item in data.get("value", []):
+                self.apply_delta_item(site_id, drive_id, item)
+                if full_scan:
+                    self.seen.add(item["id"])
+
+            url = data.get("@odata.nextLink")
+            self.store.set_value("delta_cursor", url)
+
+        if full_scan:
+            # A full enumeration lists every live item; anything we still
+            # track that it did not return was removed while we weren't
+            # following the delta feed. (A walk resumed mid-way only saw
+            # part of the feed, so it can't tell.)
+            if cursor is None:
+                self.remove_unseen()
+            self.store.set_value("delta_full_scan", None)
+        # Only saved after the walk completed, together with the cursor
+        # reset above.
+        self.delta_link = data.get("@odata.deltaLink")
+
+    def apply_delta_item(self, site_id, drive_id, item):
+        item_id = item["id"]
+
+        if "deleted" in item:
+            row = self.store.get(item_id)
+            if row is not None and row[0] == "folder":
+                self.remove_folder(item_id)
+            else:
+                self.remove_file(item_id)
+            return
+
+        if "root" in item:
+            self.store.set_path(item_id, "folder", "")
+            return
+
+        parent_path = self.store.path_of(
+            item.get("parentReference", {}).get("id"), "folder"
+        )
+        if parent_path is None:
+            print(f"Skipping {item.get('name')}: parent folder not known yet")
+            return
+        relative_path = f"{parent_path}/{item['name']}".lstrip("/")
+
+        if "folder" in item:
+            old_path = self.store.path_of(item_id, "folder")
+            if old_path and old_path != relative_path:
+                self.move_folder(old_path, relative_path)
+            self.store.set_path(item_id, "folder", relative_path)
+        elif "file" in item:
+            if self.should_sync(item["name"]):
+                self.sync_file(site_id, drive_id, item, relative_path)
+            elif self.store.path_of(item_id, "file") is not None:
+                # Renamed to something we no longer sync.
+                self.remove_file(item_id)
+
+    def move_folder(self, old_path, new_path):
+        """A renamed/moved folder: rewrite the paths of everything below it.
+
+        Its files are reported as removed under the old path and updated
+        under the new one, so the indexer re-keys their chunks.
+        """
+        old_local, new_local = self.local_path(old_path), self.local_path(new_path)
+        # Let downloads into the old folder land before it is renamed.
+        wait(list(self.pending))
+        if old_local.exists() and not new_local.exists():
+            new_local.parent.mkdir(parents=True, exist_ok=True)
+            old_local.rename(new_local)
+
+        moved_files = self.store.under(old_path, "file")
+        self.store.move_prefix(old_path, new_path)
+        for _, path in moved_files:
+            self.deleted_files.append(self.local_path(path))
+            self.updated_files.append(self.local_path(new_path + path[len(old_path):]))
+
+    def finished_downloads(self):
+        """Yields local paths as downloads complete, recording their state."""
+        for future in as_completed(list(self.pending)):
+            item_id = self.pending.pop(future)
+            if self.pending_items.get(item_id) is future:
+                del self.pending_items[item_id]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Download failed (retried next run): {e}")
+                continue
+
+            relative_path = self.store.path_of(item_id, "file")
+            if relative_path is None:
+                continue  # removed while downloading
+            self.store.mark_downloaded(item_id)
+            local_path = self.local_path(relative_path)
+            self.updated_files.append(local_path)  # Mark for indexing
+            yield local_path
+
+    def iter_sync(self):
+        """Syncs the library, yielding updated files as they become ready."""
+        site_id, drive_id = self.get_site_and_drive()
+        print(f"Starting SharePoint Sync ({self.mode})...")
+
+        self.resume_downloads(site_id, drive_id)
+
+        self.seen = set()
+        self.delta_link = None
+        if self.mode == "delta":
+            self.process_delta(site_id, drive_id)
+        else:
+            self.process_folder(site_id, drive_id)
+
+        # Downloaded in an earlier run but never indexed. Read after the
+        # listing so moved files have their new path.
+        unindexed = [self.local_path(p) for p in self.store.pending_index()]
+        # Files downloading again in this run are only indexed once the new
+        # version has landed, not from a stale or half-written copy.
+        downloading = {
+            self.local_path(path)
+            for path in map(self.store.path_of, list(self.pending_items))
+            if path
+        }
+
+        # A file can be moved, still pending and re-downloaded in the same
+        # run; each path is handed to the indexer once.
+        yielded = set()
+        for path in chain(
+            [path for path in self.updated_files if path not in downloading],
+            [path for path in unindexed if path not in downloading and path.exists()],
+            self.finished_downloads(),
+        ):
+            if path not in yielded:
+                yielded.add(path)
+                yield path
+
+        # Downloads are done (or recorded as unfinished), so it is safe to
+        # move the delta link forward.
+        if self.delta_link:
+            self.store.set_value("delta_link", self.delta_link)
+        if self.deleted_files:
+            print(f"{len(self.deleted_files)} files removed or moved in SharePoint.")
+
+    def mark_indexed(self, files):
+        """Records that these local files were indexed after their download."""
+        self.store.mark_indexed(
+            [path.relative_to(self.download_dir).as_posix() for path in files]
+        )
+
+    def run(self):
+        for _ in self.iter_sync():
+            pass
+        return self.updated_files
@@ -0,0 +1,37 @@
+import fcntl
+from pathlib import Path
+
+from config import SYNC_LOCK_DIR
+
+
+# --- Cross-Process Sync Lock ---
+class SyncLock:
+    """An exclusive lock on one library's sync, shared between processes.
+
+    The scheduled jobs (jobs/indexing.py) and the change-notification
+    receiver run in separate processes and would otherwise sync and index
+    the same library at once. The lock is a flock on a file under
+    SYNC_LOCK_DIR, so it is released by the OS if its holder dies.
+    """
+
+    def __init__(self, name, lock_dir=SYNC_LOCK_DIR):
+        self.path = Path(lock_dir) / f"{name}.lock"
+        self.file = None
+
+    def acquire(self, wait=False):
+        """Takes the lock; returns False if `wait` is off and it is held."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "a")
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            self.file.close()
+            self.file = None
+            return False
+        return True
+
+    def release(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
@@ -0,0 +1,212 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import dateutil.parser
+
+
+def parse_timestamp(value):
+    return dateutil.parser.isoparse(value).timestamp()
+
+
+# --- SharePoint Sync State Store ---
+class SyncStore:
+    """SQLite-backed sync state for one SharePoint library.
+
+    One row per known drive item (files and folders) keyed by the Graph
+    item id, with its path relative to the download directory. Files also
+    carry the remote modification time of the version being synced (as
+    text and as a parsed epoch for comparisons), when it finished
+    downloading and an index status:
+
+      pending  downloaded, not indexed yet
+      indexed  indexed after its last download
+
+    A file row without `downloaded_at` was seen but its download never
+    finished. Every change is committed on its own, so an interrupted run
+    loses at most the file it was working on. The delta link and the
+    cursor of an unfinished delta walk live in a small key/value table.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                item_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                path TEXT NOT NULL,
+                remote_modified TEXT,
+                remote_modified_ts REAL,
+                downloaded_at REAL,
+                index_status TEXT,
+                indexed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS items_path ON items (path);
+            CREATE INDEX IF NOT EXISTS items_index_status ON items (index_status);
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self.conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            cur = self.conn.execute(sql, params)
+            self.conn.commit()
+            return cur
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    # --- Key/value ---
+    def get_value(self, key):
+        rows = self._query("SELECT value FROM kv WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def set_value(self, key, value):
+        if value is None:
+            self._execute("DELETE FROM kv WHERE key = ?", (key,))
+        else:
+            self._execute(
+                "INSERT INTO kv (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    # --- Items ---
+    def get(self, item_id):
+        """Returns (kind, path, remote_modified_ts, downloaded_at) or None."""
+        rows = self._query(
+            "SELECT kind, path, remote_modified_ts, downloaded_at FROM items WHERE item_id = ?",
+            (item_id,),
+        )
+        return rows[0] if rows else None
+
+    def path_of(self, item_id, kind=None):
+        row = self.get(item_id)
+        if row is None or (kind and row[0] != kind):
+            return None
+        return row[1]
+
+    def set_path(self, item_id, kind, path):
+        self._execute(
+            "INSERT INTO items (item_id, kind, path) VALUES (?, ?, ?) "
+            "ON CONFLICT(item_id) DO UPDATE SET kind = excluded.kind, path = excluded.path",
+            (item_id, kind, path),
+        )
+
+    def start_download(self, item_id, path, remote_modified):
+        """Records a file version whose download is starting."""
+        self._execute(
+            "INSERT INTO items (item_id, kind, path, remote_modified, remote_modified_ts) "
+            "VALUES (?, 'file', ?, ?, ?) "
+            "ON CONFLICT(item_id) DO UPDATE SET kind = 'file', path = excluded.path, "
+            "remote_modified = excluded.remote_modified, "
+            "remote_modified_ts = excluded.remote_modified_ts, "
+            "downloaded_at = NULL, index_status = NULL",
+            (item_id, path, remote_modified, parse_timestamp(remote_modified)),
+        )
+
+    def mark_downloaded(self, item_id):
+        self._execute(
+            "UPDATE items SET downloaded_at = ?, index_status = 'pending' WHERE item_id = ?",
+            (time.time(), item_id),
+        )
+
+    def mark_indexed(self, paths):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE items SET index_status = 'indexed', indexed_at = ? "
+                "WHERE kind = 'file' AND path = ?",
+                [(now, path) for path in paths],
+            )
+            self.conn.commit()
+
+    def forget(self, item_id):
+        self._execute("DELETE FROM items WHERE item_id = ?", (item_id,))
+
+    def under(self, prefix, kind):
+        """(item_id, path) of every item of `kind` below folder path `prefix`."""
+        prefix = prefix + "/"
+        return self._query(
+            "SELECT item_id, path FROM items WHERE kind = ? AND substr(path, 1, ?) = ?",
+            (kind, len(prefix), prefix),
+        )
+
+    def move_prefix(self, old_prefix, new_prefix):
+        old_prefix, new_prefix = old_prefix + "/", new_prefix + "/"
+        self._execute(
+            "UPDATE items SET path = ? || substr(path, ?) WHERE substr(path, 1, ?) = ?",
+            (new_prefix, len(old_prefix) + 1, len(old_prefix), old_prefix),
+        )
+
+    def item_ids(self, kind):
+        return [row[0] for row in self._query("SELECT item_id FROM items WHERE kind = ?", (kind,))]
+
+    def file_paths(self):
+        return [row[0] for row in self._query("SELECT path FROM items WHERE kind = 'file'")]
+
+    def incomplete_downloads(self):
+        """(item_id, path) of files whose download never finished."""
+        return self._query(
+            "SELECT item_id, path FROM items WHERE kind = 'file' AND downloaded_at IS NULL"
+        )
+
+    def pending_index(self):
+        return [
+            row[0]
+            for row in self._query(
+                "SELECT path FROM items WHERE kind = 'file' AND index_status = 'pending'"
+            )
+        ]
+
+    def is_empty(self):
+        return not self._query("SELECT 1 FROM items LIMIT 1")
+
+    # --- Migration ---
+    def import_json(self, state_file, delta_file=None):
+        """One-off import of the old sync_state.json (+ delta file) state."""
+        state_file = Path(state_file)
+        sync_state = json.loads(state_file.read_text()) if state_file.exists() else {}
+        delta_state = {}
+        if delta_file and Path(delta_file).exists():
+            delta_state = json.loads(Path(delta_file).read_text())
+        if not sync_state and not delta_state:
+            return 0
+
+        files = delta_state.get("files", {})
+        now = time.time()
+        rows = [
+            (item_id, files.get(item_id, ""), modified, parse_timestamp(modified), now)
+            for item_id, modified in sync_state.items()
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO items (item_id, kind, path, remote_modified, "
+                "remote_modified_ts, downloaded_at, index_status) "
+                "VALUES (?, 'file', ?, ?, ?, ?, 'indexed')",
+                rows,
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO items (item_id, kind, path) VALUES (?, 'folder', ?)",
+                delta_state.get("folders", {}).items(),
+            )
+            if delta_state.get("delta_link"):
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value) VALUES ('delta_link', ?)",
+                    (delta_state["delta_link"],),
+                )
+            self.conn.commit()
+        return len(rows)
@@ -0,0 +1,114 @@
+import csv
+import re
+
+from docling_core.types.doc import DocItemLabel, DoclingDocument
+
+# Lightweight readers for plain-text formats. They stream the file line by
+# line and build a DoclingDocument directly, so these files skip the
+# converter's layout pipeline but still go through the same chunker.
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)(?:\s+#+)?\s*$")
+
+
+def _open(path):
+    return open(path, "r", encoding="utf-8", errors="replace", newline="")
+
+
+def _add_paragraph(doc, lines, label=DocItemLabel.TEXT):
+    text = "\n".join(lines).strip()
+    if text:
+        doc.add_text(label=label, text=text)
+    lines.clear()
+
+
+def load_markdown(path):
+    """Headings become section headers; blank lines split paragraphs."""
+    doc = DoclingDocument(name=path.stem)
+    paragraph = []
+    code = None
+
+    with _open(path) as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+
+            if line.lstrip().startswith("```"):
+                if code is None:
+                    _add_paragraph(doc, paragraph)
+                    code = []
+                else:
+                    _add_paragraph(doc, code, DocItemLabel.CODE)
+                    code = None
+                continue
+            if code is not None:
+                code.append(line)
+                continue
+
+            heading = HEADING_PATTERN.match(line)
+            if heading:
+                _add_paragraph(doc, paragraph)
+                level, title = heading.groups()
+                if len(level) == 1:
+                    doc.add_title(text=title)
+                else:
+                    doc.add_heading(text=title, level=len(level) - 1)
+            elif not line.strip():
+                _add_paragraph(doc, paragraph)
+            else:
+                paragraph.append(line)
+
+    _add_paragraph(doc, paragraph)
+    if code:
+        _add_paragraph(doc, code, DocItemLabel.CODE)
+    return doc
+
+
+def load_text(path):
+    """One text item per blank-line separated paragraph."""
+    doc = DoclingDocument(name=path.stem)
+    paragraph = []
+
+    with _open(path) as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if line.strip():
+                paragraph.append(line)
+            else:
+                _add_paragraph(doc, paragraph)
+
+    _add_paragraph(doc, paragraph)
+    return doc
+
+
+def load_csv(path):
+    """One text item per row, rendered as "column = value" pairs."""
+    doc = DoclingDocument(name=path.stem)
+
+    with _open(path) as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+
+        reader = csv.reader(f, dialect)
+        header = next(reader, None)
+        if header is None:
+            return doc
+
+        for row in reader:
+            pairs = [
+                f"{column.strip()} = {value.strip()}"
+                for column, value in zip(header, row)
+                if value.strip()
+            ]
+            if pairs:
+                doc.add_text(label=DocItemLabel.TEXT, text=", ".join(pairs))
+    return doc
+
+
+FAST_PATH_LOADERS = {
+    ".md": load_markdown,
+    ".txt": load_text,
+    ".csv": load_csv,
+}
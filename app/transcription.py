@@ -0,0 +1,282 @@
+import os
+import re
+import tempfile
+from bisect import bisect_right
+from pathlib import Path
+
+# Worker-side state for process-pool transcription. Like conversion_worker,
+# this module is kept free of Supabase/LLM imports so spawned workers only
+# load Docling and Whisper.
+ASR_MODEL = "WHISPER_TURBO"  # a spec in docling.datamodel.asr_model_specs
+ASR_LANGUAGE = "es"
+
+_converter = None
+_vad_options = None
+
+# Docling writes each Whisper segment as "[time: 1.2-4.8] text".
+_TIME_PREFIX = re.compile(r"^\[time:\s*([\d.]+)-([\d.]+)\]\s*(?:\[speaker:[^\]]*\]\s*)?")
+
+
+def build_converter(language=ASR_LANGUAGE):
+    """A DocumentConverter running Docling's ASR pipeline with Whisper Turbo."""
+    from docling.datamodel import asr_model_specs
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import AsrPipelineOptions
+    from docling.document_converter import AudioFormatOption, DocumentConverter
+    from docling.pipeline.asr_pipeline import AsrPipeline
+
+    pipeline_options = AsrPipelineOptions(
+        asr_options=getattr(asr_model_specs, ASR_MODEL), language=language
+    )
+    return DocumentConverter(
+        format_options={
+            InputFormat.AUDIO: AudioFormatOption(
+                pipeline_cls=AsrPipeline,
+                pipeline_options=pipeline_options,
+            )
+        }
+    )
+
+
+def parse_segments(document):
+    """Returns [{"text", "start", "end"}] for the transcript's text items.
+
+    start/end are seconds, or None when the item carries no timing.
+    """
+    segments = []
+    for item in document.texts:
+        match = _TIME_PREFIX.match(item.text)
+        if match:
+            start, end = float(match.group(1)), float(match.group(2))
+            text = item.text[match.end() :]
+        else:
+            start = end = None
+            text = item.text
+        text = text.strip()
+        if text:
+            segments.append({"text": text, "start": start, "end": end})
+    return segments
+
+
+# --- Voice Activity Detection ---
+def frame_energies(file_path, frame_seconds=0.032, frames_per_block=4096):
+    """Mean power of consecutive mono frames, read block by block.
+
+    Returns (energies, frame length in samples, sample rate); memory stays
+    at one block whatever the length of the file.
+    """
+    import numpy as np
+    import soundfile
+
+    info = soundfile.info(str(file_path))
+    frame = max(1, int(info.samplerate * frame_seconds))
+    energies = []
+    for block in soundfile.blocks(
+        str(file_path), blocksize=frame * frames_per_block, dtype="float32", always_2d=True
+    ):
+        mono = block.mean(axis=1)
+        n = len(mono) // frame
+        if n:
+            frames = mono[: n * frame].reshape(n, frame)
+            energies.append(np.einsum("ij,ij->i", frames, frames) / frame)
+    energies = np.concatenate(energies) if energies else np.zeros(0, dtype="float32")
+    return energies, frame, info.samplerate
+
+
+def detect_speech(
+    energies, frame_seconds, top_db=35, min_silence=0.6, padding=0.2, min_speech=0.25
+):
+    """Returns [(start, end)] seconds of the frames with speech.
+
+    Frames more than `top_db` below the loudest one count as silence (the
+    same rule as librosa.effects.split). Regions are padded by `padding`
+    seconds so words are not clipped, pauses shorter than `min_silence`
+    are bridged and blips shorter than `min_speech` are dropped.
+    """
+    import numpy as np
+
+    if not len(energies) or energies.max() <= 0:
+        return []
+    voiced = energies > energies.max() * 10 ** (-top_db / 10)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+
+    duration = len(energies) * frame_seconds
+    regions = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        start = max(0.0, float(start) * frame_seconds - padding)
+        end = min(duration, float(end) * frame_seconds + padding)
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return [(start, end) for start, end in regions if end - start >= min_speech]
+
+
+def trim_silence(file_path, vad_options, block_seconds=60):
+    """Writes only the speech of a call to a temporary WAV.
+
+    Returns (path, offsets) where offsets holds (trimmed start, original
+    start) for each kept region, or (None, []) when there is no speech.
+    When trimming would save little the original file is returned with
+    offsets of None. Audio is streamed in blocks in both passes.
+    """
+    import soundfile
+
+    energies, frame, rate = frame_energies(file_path)
+    regions = detect_speech(energies, frame / rate, **vad_options)
+    duration = len(energies) * frame / rate
+    speech = sum(end - start for start, end in regions)
+    print(f"{Path(file_path).name}: {speech:.0f}s of speech in {duration:.0f}s")
+    if not regions:
+        return None, []
+    if speech > 0.9 * duration:
+        return file_path, None
+
+    fd, path = tempfile.mkstemp(suffix=".wav", prefix="speech-")
+    os.close(fd)
+    offsets = []
+    position = 0
+    block = int(block_seconds * rate)
+    with soundfile.SoundFile(str(file_path)) as source, soundfile.SoundFile(
+        path, "w", rate, source.channels, subtype="PCM_16"
+    ) as target:
+        for start, end in regions:
+            first, last = int(start * rate), int(end * rate)
+            offsets.append((position / rate, first / rate))
+            source.seek(first)
+            while first < last:
+                data = source.read(min(block, last - first), dtype="int16")
+                if not len(data):
+                    break
+                target.write(data)
+                first += len(data)
+                position += len(data)
+    return Path(path), offsets
+
+
+def to_original_time(seconds, offsets):
+    """Maps a time in the trimmed audio back onto the original call."""
+    if seconds is None:
+        return None
+    i = max(0, bisect_right([trimmed for trimmed, _ in offsets], seconds) - 1)
+    trimmed, original = offsets[i]
+    return round(original + seconds - trimmed, 2)
+
+
+def transcribe_with(converter, file_path, vad_options=None):
+    """Transcribes a call, sending only its speech through Whisper when
+    `vad_options` (keyword arguments for detect_speech) are given."""
+    if vad_options is None:
+        return parse_segments(converter.convert(file_path).document)
+
+    path, offsets = trim_silence(file_path, vad_options)
+    if path is None:
+        return []
+    if offsets is None:
+        return parse_segments(converter.convert(path).document)
+    try:
+        segments = parse_segments(converter.convert(path).document)
+    finally:
+        path.unlink(missing_ok=True)
+    for segment in segments:
+        segment["start"] = to_original_time(segment["start"], offsets)
+        segment["end"] = to_original_time(segment["end"], offsets)
+    return segments
+
+
+# --- Windowing ---
+def split_windows(file_path, window_seconds, overlap_seconds):
+    """Yields (offset seconds, path, temporary) windows of a call.
+
+    Each window is `window_seconds` long plus `overlap_seconds` shared with
+    the next one. Windows are read from disk one at a time and written to
+    temporary WAVs at the source's own rate, so memory stays at one window
+    whatever the length of the call. A call that fits in one window (or
+    that soundfile cannot read) is yielded as is.
+    """
+    import soundfile
+
+    try:
+        source = soundfile.SoundFile(file_path)
+    except RuntimeError:
+        yield 0.0, file_path, False
+        return
+
+    with source:
+        rate = source.samplerate
+        step = int(window_seconds * rate)
+        size = int((window_seconds + overlap_seconds) * rate)
+        if source.frames <= size:
+            yield 0.0, file_path, False
+            return
+
+        for start in range(0, source.frames, step):
+            source.seek(start)
+            data = source.read(size, dtype="int16", always_2d=True)
+            fd, path = tempfile.mkstemp(suffix=".wav", prefix="window-")
+            os.close(fd)
+            soundfile.write(path, data, rate, subtype="PCM_16")
+            del data
+            yield start / rate, Path(path), True
+            if start + size >= source.frames:
+                break
+
+
+def shift_segments(segments, offset):
+    for segment in segments:
+        for key in ("start", "end"):
+            if segment[key] is not None:
+                segment[key] = round(segment[key] + offset, 2)
+    return segments
+
+
+def stitch_windows(windows, overlap_seconds):
+    """Joins [(offset, segments)] of consecutive windows into one transcript.
+
+    Segments are already on the call's timeline. Each overlap is cut in its
+    middle and a segment is kept by the window that holds its midpoint, so
+    speech in the overlap is not transcribed twice. Segments without
+    timings are de-duplicated by text.
+    """
+    stitched = []
+    for i, (offset, segments) in enumerate(windows):
+        lower = offset + overlap_seconds / 2 if i > 0 else float("-inf")
+        upper = (
+            windows[i + 1][0] + overlap_seconds / 2 if i + 1 < len(windows) else float("inf")
+        )
+        for segment in segments:
+            if segment["start"] is None or segment["end"] is None:
+                if not stitched or stitched[-1]["text"] != segment["text"]:
+                    stitched.append(segment)
+                continue
+            if lower <= (segment["start"] + segment["end"]) / 2 < upper:
+                stitched.append(segment)
+    return stitched
+
+
+def init_worker(num_threads=1, vad_options=None, language=ASR_LANGUAGE):
+    """Process pool initializer: loads Whisper once per worker."""
+    global _converter, _vad_options
+
+    # Limit intra-op threads before torch is imported so N workers do not
+    # each spin up one thread per core.
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+
+    from docling.datamodel.base_models import InputFormat
+
+    try:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+    _vad_options = vad_options
+    _converter = build_converter(language)
+    # Load the Whisper weights now rather than on the first call.
+    _converter.initialize_pipeline(InputFormat.AUDIO)
+
+
+def transcribe(file_path):
+    """Transcribes one call in the worker and returns its segments."""
+    return transcribe_with(_converter, file_path, _vad_options)
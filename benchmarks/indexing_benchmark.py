@@ -0,0 +1,507 @@
+"""Indexing throughput benchmark with local stand-ins.
+
+Runs the document and/or audio indexers against a generated fixture corpus
+with a fake embedding backend (configurable latency), an in-memory
+stand-in for the Supabase table and, for audio, fake ASR and analysis
+clients. Nothing leaves the machine.
+
+    uv run benchmarks/indexing_benchmark.py
+    uv run benchmarks/indexing_benchmark.py --target documents --files 20 --embed-latency-ms 150
+    uv run benchmarks/indexing_benchmark.py --json bench.json
+
+Reports files/s, chunks/s, embedding calls, DB round-trips and peak RSS,
+per pipeline stage for the document indexer. Worker processes
+(conversion pool) are not included in the RSS figures.
+"""
+
+import argparse
+import array
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import wave
+from pathlib import Path
+from types import SimpleNamespace
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+# The app modules read their configuration at import time; point everything
+# at local, throwaway locations before importing them.
+BENCH_DIR = Path(tempfile.mkdtemp(prefix="indexing-bench-"))
+os.environ.update(
+    {
+        "SUPABASE_URL": "http://localhost:54321",
+        "SUPABASE_KEY": "bench",
+        "LLM_SERVICE": "openai",
+        "LLM_SERVICE_API_KEY": "bench",
+        "EMBEDDING_CACHE_PATH": "",
+        "CONVERSION_CACHE_DIR": "",
+        "TRANSCRIPT_CACHE_DIR": "",
+        "INDEXER_MANIFEST_PATH": str(BENCH_DIR / "index_manifest.json"),
+    }
+)
+
+import tiktoken  # noqa: E402
+
+from config import EmbeddingService  # noqa: E402
+from pipeline import current_rss_bytes  # noqa: E402
+
+
+# --- Fake embedding backend ---
+class FakeEmbeddingService(EmbeddingService):
+    """Real batching logic, fake provider: sleeps `latency` per request."""
+
+    def __init__(self, latency, dimensions=1536):
+        super().__init__()
+        self.latency = latency
+        self.dimensions = dimensions
+        self.calls = 0
+        self.texts = 0
+        self.lock = threading.Lock()
+        # Byte-level encoding so the benchmark needs no tiktoken download.
+        self._tokenizer = tiktoken.Encoding(
+            "bench-bytes",
+            pat_str=r"\S+|\s+",
+            mergeable_ranks={bytes([i]): i for i in range(256)},
+            special_tokens={},
+        )
+
+    def _embed_batch(self, texts):
+        with self.lock:
+            self.calls += 1
+            self.texts += len(texts)
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text):
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        return [rng.uniform(-1, 1) for _ in range(self.dimensions)]
+
+
+# --- In-memory Supabase stand-in ---
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.operation = None
+        self.columns = None
+        self.rows = None
+        self.filters = []
+        self.window = None
+        self.count = None
+
+    def select(self, columns="*", count=None):
+        self.operation, self.columns, self.count = "select", columns, count
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.operation = "insert"
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def delete(self, count=None, **kwargs):
+        self.operation, self.count = "delete", count
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, lambda v: v == str(value)))
+        return self
+
+    def in_(self, column, values):
+        allowed = {str(v) for v in values}
+        self.filters.append((column, lambda v: v in allowed))
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end)
+        return self
+
+    @staticmethod
+    def get_value(row, column):
+        if "->>" in column:
+            field, key = column.split("->>", 1)
+            value = (row.get(field) or {}).get(key)
+        else:
+            value = row.get(column)
+        return None if value is None else str(value)
+
+    def matches(self, row):
+        return all(test(self.get_value(row, column)) for column, test in self.filters)
+
+    def project(self, row):
+        if self.columns in (None, "*"):
+            return dict(row)
+        result = {}
+        for column in self.columns.split(","):
+            column = column.strip()
+            alias, _, source = column.rpartition(":")
+            source = source or column
+            name = alias or source.split("->>")[-1]
+            value = self.get_value(row, source) if "->>" in source else row.get(source)
+            result[name] = value
+        return result
+
+    def execute(self):
+        self.db.round_trip()
+        with self.db.lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.operation == "insert":
+                for row in self.rows:
+                    self.db.next_id += 1
+                    rows.append({"id": self.db.next_id, **row})
+                return FakeResponse(self.rows)
+            if self.operation == "delete":
+                kept = [r for r in rows if not self.matches(r)]
+                deleted = len(rows) - len(kept)
+                self.db.tables[self.table] = kept
+                return FakeResponse([], count=deleted)
+
+            selected = [self.project(r) for r in rows if self.matches(r)]
+            count = len(selected)
+            if self.window:
+                start, end = self.window
+                selected = selected[start : end + 1]
+            return FakeResponse(selected, count=count)
+
+
+class FakeSupabase:
+    """Just enough of the supabase-py query builder for the indexers."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.tables = {}
+        self.next_id = 0
+        self.round_trips = 0
+        self.lock = threading.Lock()
+
+    def round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        time.sleep(self.latency)
+
+    def schema(self, name):
+        return SimpleNamespace(table=lambda table: FakeQuery(self, f"{name}.{table}"))
+
+    def table(self, table):
+        return FakeQuery(self, table)
+
+    def row_count(self):
+        return sum(len(rows) for rows in self.tables.values())
+
+
+# --- Audio stand-ins ---
+class FakeAsrConverter:
+    """Returns a synthetic transcript after `latency` seconds per minute of
+    audio it is given (so trimming silence shows up in the timings)."""
+
+    def __init__(self, latency, segments=60):
+        self.latency = latency
+        self.segments = segments
+
+    def convert(self, file_path):
+        with wave.open(str(file_path), "rb") as w:
+            minutes = w.getnframes() / w.getframerate() / 60
+        time.sleep(self.latency * minutes)
+        rng = random.Random(str(file_path))
+        texts = [
+            SimpleNamespace(
+                text=" ".join(rng.choice(SPANISH_WORDS) for _ in range(rng.randint(8, 30)))
+            )
+            for _ in range(self.segments)
+        ]
+        return SimpleNamespace(document=SimpleNamespace(texts=texts))
+
+
+class FakeChatClient:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        content = json.dumps(
+            {
+                "sentiment_score": 7,
+                "call_purpose": "Soporte",
+                "resolution_status": "Resuelto",
+                "summary": "Llamada de prueba.",
+                "recommendation": "Ninguna.",
+            }
+        )
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))]
+        )
+
+
+# --- Fixture corpus ---
+SPANISH_WORDS = (
+    "política cooperativa socio crédito ahorro préstamo cuota tasa interés "
+    "solicitud aprobación comité gerencia departamento procedimiento manual "
+    "cliente pago factura cuenta saldo plazo garantía requisito documento"
+).split()
+
+
+def paragraph(rng, words=60):
+    return " ".join(rng.choice(SPANISH_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_markdown(path, rng):
+    sections = [f"# Manual {path.stem}\n"]
+    for s in range(8):
+        sections.append(f"## Sección {s + 1}\n")
+        sections.extend(paragraph(rng) + "\n" for _ in range(4))
+    path.write_text("\n".join(sections), encoding="utf-8")
+
+
+def make_text(path, rng):
+    path.write_text("\n\n".join(paragraph(rng) for _ in range(30)), encoding="utf-8")
+
+
+def make_csv(path, rng):
+    lines = ["socio,producto,monto,estado"]
+    for i in range(400):
+        lines.append(
+            f"{i},{rng.choice(SPANISH_WORDS)},{rng.randint(100, 90000)},{rng.choice(['activo', 'cerrado'])}"
+        )
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def make_docx(path, rng):
+    import docx
+
+    document = docx.Document()
+    for s in range(6):
+        document.add_heading(f"Capítulo {s + 1}", level=1)
+        for _ in range(5):
+            document.add_paragraph(paragraph(rng))
+    document.save(path)
+
+
+def make_pptx(path, rng):
+    import pptx
+
+    presentation = pptx.Presentation()
+    for s in range(6):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Diapositiva {s + 1}"
+        slide.placeholders[1].text = paragraph(rng, 40)
+    presentation.save(path)
+
+
+def make_xlsx(path, rng):
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["socio", "producto", "monto"])
+    for i in range(200):
+        sheet.append([i, rng.choice(SPANISH_WORDS), rng.randint(100, 90000)])
+    workbook.save(path)
+
+
+DOCUMENT_MAKERS = {
+    ".md": make_markdown,
+    ".txt": make_text,
+    ".csv": make_csv,
+    ".docx": make_docx,
+    ".pptx": make_pptx,
+    ".xlsx": make_xlsx,
+}
+
+
+def build_document_corpus(root, files_per_format, seed=7):
+    rng = random.Random(seed)
+    files = []
+    for suffix, maker in DOCUMENT_MAKERS.items():
+        folder = root / f"Formato {suffix[1:].upper()}"
+        folder.mkdir(parents=True, exist_ok=True)
+        for i in range(files_per_format):
+            path = folder / f"documento_{i:03d}{suffix}"
+            try:
+                maker(path, rng)
+            except ImportError as e:
+                print(f"Skipping {suffix} fixtures: {e}")
+                break
+            files.append(path)
+    return files
+
+
+def build_audio_corpus(root, calls, seconds=60, sample_rate=16000):
+    """Calls alternating 2 s of a speech-like modulated tone with 3 s of
+    silence (hold time)."""
+    folder = root / "Llamadas"
+    folder.mkdir(parents=True, exist_ok=True)
+    samples = array.array(
+        "h",
+        (
+            int(8000 * math.sin(2 * math.pi * 220 * t) * abs(math.sin(2 * math.pi * 3 * t)))
+            if t % 5 < 2
+            else 0
+            for t in (n / sample_rate for n in range(sample_rate * seconds))
+        ),
+    )
+    audio = samples.tobytes()
+    files = []
+    for i in range(calls):
+        path = folder / f"[Agente {i}]_{1000 + i}-8095550{i:03d}_20260109{i:06d}.wav"
+        with wave.open(str(path), "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(sample_rate)
+            w.writeframes(audio)
+        files.append(path)
+    return files
+
+
+# --- Runners ---
+def summarize(name, elapsed, files, db, embedder, stages, rss_before):
+    rows = db.row_count()
+    return {
+        "target": name,
+        "files": files,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(files / elapsed, 2) if elapsed else None,
+        "chunks": rows,
+        "chunks_per_second": round(rows / elapsed, 2) if elapsed else None,
+        "embedding_calls": embedder.calls,
+        "embedded_texts": embedder.texts,
+        "embedding_retries": embedder.scheduler.metrics()["retries"],
+        "embedding_dropped": embedder.scheduler.metrics()["dropped"],
+        "db_round_trips": db.round_trips,
+        "rss_start_mb": round(rss_before / (1024 * 1024), 1),
+        "peak_rss_mb": round(peak_rss_bytes() / (1024 * 1024), 1),
+        "stages": stages,
+    }
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return current_rss_bytes()
+
+
+def run_documents(args):
+    import indexer as documents
+
+    root = BENCH_DIR / "documents"
+    files = build_document_corpus(root, args.files)
+
+    embedder = FakeEmbeddingService(args.embed_latency_ms / 1000)
+    db = FakeSupabase(args.db_latency_ms / 1000)
+    documents.global_embedding_service_instance = embedder
+
+    indexer = documents.KnowledgeBaseIndexer(
+        root, conversion_workers=args.conversion_workers
+    )
+    indexer.supabase = indexer.writer.supabase = db
+
+    rss_before = current_rss_bytes()
+    started = time.perf_counter()
+    indexer.run_indexer(force=True)
+    elapsed = time.perf_counter() - started
+
+    return summarize(
+        "documents", elapsed, len(files), db, embedder, indexer.last_run_stats, rss_before
+    )
+
+
+def run_audio(args):
+    import audio_ingestion as audio
+
+    root = BENCH_DIR / "audio"
+    files = build_audio_corpus(root, args.calls)
+
+    embedder = FakeEmbeddingService(args.embed_latency_ms / 1000)
+    db = FakeSupabase(args.db_latency_ms / 1000)
+    audio.global_embedding_service_instance = embedder
+
+    indexer = audio.KnowledgeBaseIndexer(root)
+    indexer.supabase = indexer.writer.supabase = db
+    indexer.converter = FakeAsrConverter(args.asr_latency_ms / 1000)
+    indexer.chat_client = FakeChatClient(args.llm_latency_ms / 1000)
+
+    rss_before = current_rss_bytes()
+    started = time.perf_counter()
+    asyncio.run(indexer.run_indexer())
+    elapsed = time.perf_counter() - started
+
+    # The audio indexer runs each call as one task rather than through
+    # pipeline stages, so there is no per-stage breakdown to report.
+    return summarize("audio", elapsed, len(files), db, embedder, {}, rss_before)
+
+
+def print_report(result):
+    print(f"\n=== {result['target']} ===")
+    for key in (
+        "files",
+        "seconds",
+        "files_per_second",
+        "chunks",
+        "chunks_per_second",
+        "embedding_calls",
+        "embedded_texts",
+        "embedding_retries",
+        "embedding_dropped",
+        "db_round_trips",
+        "rss_start_mb",
+        "peak_rss_mb",
+    ):
+        print(f"{key:>20}: {result[key]}")
+    if result["stages"]:
+        print(f"\n{'stage':<10}{'workers':>8}{'items':>8}{'failed':>8}{'busy s':>10}{'peak MB':>10}")
+        for name, stage in result["stages"].items():
+            print(
+                f"{name:<10}{stage['workers']:>8}{stage['processed']:>8}{stage['failed']:>8}"
+                f"{stage['busy_seconds']:>10}{stage['peak_rss_mb']:>10}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["documents", "audio", "all"], default="all")
+    parser.add_argument("--files", type=int, default=5, help="documents per format")
+    parser.add_argument("--calls", type=int, default=10, help="audio calls")
+    parser.add_argument("--embed-latency-ms", type=float, default=100)
+    parser.add_argument("--db-latency-ms", type=float, default=20)
+    parser.add_argument(
+        "--asr-latency-ms", type=float, default=500, help="fake ASR time per minute of audio"
+    )
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--conversion-workers", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    if args.target in ("documents", "all"):
+        results.append(run_documents(args))
+    if args.target in ("audio", "all"):
+        results.append(run_audio(args))
+
+    for result in results:
+        print_report(result)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=4))
+    print(f"\nFixtures and manifest in {BENCH_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,27 @@
-import schedule
-import time
+import asyncio
+import sys
 from app.indexer import scheduled_indexing
 from app.audio_ingestion import scheduled_audio_indexing
+from config import (
+    DOCUMENT_JOB_INTERVAL_HOURS,
+    AUDIO_JOB_INTERVAL_HOURS,
+    DOCUMENT_JOB_THREADS,
+    JOB_METRICS_PATH,
+)
+from jobs.runner import JobRunner
 
-def job():
-    print("Starting indexing job...")
-    scheduled_indexing()
-    print("Indexing job completed.")
+# The document job (blocking: Docling conversion, threaded pipeline) runs on
+# its own thread pool; the audio job is a coroutine awaited on the event
+# loop. Both run concurrently, each guarded against overlapping itself.
+runner = JobRunner(metrics_path=JOB_METRICS_PATH)
+runner.add(
+    "indexing",
+    scheduled_indexing,
+    DOCUMENT_JOB_INTERVAL_HOURS * 3600,
+    threads=DOCUMENT_JOB_THREADS,
+)
+runner.add("audio_ingestion", scheduled_audio_indexing, AUDIO_JOB_INTERVAL_HOURS * 3600)
 
-def audio_job():
-    print("Starting audio ingestion job...")
-    scheduled_audio_indexing()
-    print("Audio ingestion completed.")
-
-schedule.every(1).day.do(job)
-schedule.every(1).day.do(audio_job)
-
-while True:
-    schedule.run_pending()
-    time.sleep(1)
\ No newline at end of file
+if __name__ == "__main__":
+    # --now runs both jobs immediately instead of waiting one interval.
+    asyncio.run(runner.serve(run_now="--now" in sys.argv))
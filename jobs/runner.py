@@ -0,0 +1,111 @@
+import asyncio
+import inspect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+# --- Job Definition ---
+class Job:
+    """A periodic job. `func` may be a coroutine function or a plain one.
+
+    Plain functions run on the job's own thread pool (`threads` workers),
+    so a blocking job never holds up the event loop or another job's
+    threads. `func` may return the number of items it processed, which is
+    recorded as throughput.
+    """
+
+    def __init__(self, name, func, interval_seconds, threads=1):
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.executor = None
+        if not inspect.iscoroutinefunction(func):
+            self.executor = ThreadPoolExecutor(
+                max_workers=threads, thread_name_prefix=f"job-{name}"
+            )
+        # Held for the whole run; a tick that finds it taken is skipped.
+        self.running = asyncio.Lock()
+
+
+# --- Async Job Runner ---
+class JobRunner:
+    """Runs jobs on fixed intervals on one event loop.
+
+    Different jobs run concurrently; a job whose previous run is still in
+    progress is skipped rather than started twice. Every run appends a
+    JSON line with its duration, item count and throughput to
+    `metrics_path`.
+    """
+
+    def __init__(self, metrics_path="job_runs.jsonl"):
+        self.jobs = []
+        self.metrics_path = Path(metrics_path) if metrics_path else None
+
+    def add(self, name, func, interval_seconds, threads=1):
+        job = Job(name, func, interval_seconds, threads)
+        self.jobs.append(job)
+        return job
+
+    async def run_job(self, job):
+        """Runs a job once; returns its metrics, or None if it was already running."""
+        if job.running.locked():
+            print(f"Skipping {job.name}: previous run still in progress.")
+            return None
+
+        async with job.running:
+            print(f"Starting {job.name}...")
+            started = time.perf_counter()
+            record = {
+                "job": job.name,
+                "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            try:
+                if job.executor is None:
+                    processed = await job.func()
+                else:
+                    loop = asyncio.get_running_loop()
+                    processed = await loop.run_in_executor(job.executor, job.func)
+                record["status"] = "ok"
+            except Exception as e:
+                processed = None
+                record["status"] = "failed"
+                record["error"] = str(e)
+                print(f"{job.name} failed: {e}")
+
+            duration = time.perf_counter() - started
+            record["duration_seconds"] = round(duration, 3)
+            if isinstance(processed, int):
+                record["items"] = processed
+                record["items_per_second"] = round(processed / duration, 3) if duration else None
+            print(f"{job.name} finished in {duration:.1f}s ({record['status']}).")
+            self.record(record)
+            return record
+
+    def record(self, record):
+        if self.metrics_path is None:
+            return
+        self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.metrics_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def _schedule(self, job, run_now):
+        tasks = set()
+        if not run_now:
+            await asyncio.sleep(job.interval_seconds)
+        while True:
+            # Started as a task so a long run doesn't shift the schedule;
+            # overlapping ticks are skipped by run_job.
+            task = asyncio.create_task(self.run_job(job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            await asyncio.sleep(job.interval_seconds)
+
+    async def serve(self, run_now=False):
+        await asyncio.gather(*(self._schedule(job, run_now) for job in self.jobs))
+
+    async def run_once(self):
+        """Runs every job once, concurrently."""
+        return await asyncio.gather(*(self.run_job(job) for job in self.jobs))
@@ -0,0 +1,11 @@
+import os
+import sys
+from pathlib import Path
+
+# The app modules import flat (PYTHONPATH=app), and config builds its
+# Supabase/LLM clients at import time.
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ.setdefault("LLM_SERVICE_API_KEY", "test")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
@@ -0,0 +1,147 @@
+import threading
+import time
+import urllib.error
+
+import pytest
+
+from change_notifications import (
+    ChangeQueue,
+    NotificationReceiver,
+    emulate_notification,
+)
+
+CLIENT_STATE = "test-secret"
+
+
+class Handlers:
+    """Records how often each target was synced."""
+
+    def __init__(self, *targets, delay=0):
+        self.calls = {target: 0 for target in targets}
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, target):
+        def handler():
+            time.sleep(self.delay)
+            with self.lock:
+                self.calls[target] += 1
+
+        return handler
+
+    def handlers(self):
+        return {target: self(target) for target in self.calls}
+
+
+def wait_for_runs(queue, target, runs, timeout=5):
+    deadline = time.monotonic() + timeout
+    while queue.runs[target] < runs and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return queue.runs[target]
+
+
+@pytest.fixture
+def receiver():
+    handlers = Handlers("documents", "audio")
+    queue = ChangeQueue(handlers.handlers(), debounce_seconds=0.2, max_delay_seconds=5)
+    receiver = NotificationReceiver(
+        queue,
+        {"doc-drive": "documents", "audio-drive": "audio"},
+        CLIENT_STATE,
+        host="127.0.0.1",
+        port=0,
+    ).start()
+    receiver.url = f"http://127.0.0.1:{receiver.port}/"
+    receiver.handlers = handlers
+    yield receiver
+    receiver.stop()
+
+
+def test_validation_handshake_echoes_token(receiver):
+    status, body = emulate_notification(receiver.url, "doc-drive", CLIENT_STATE, validate=True)
+
+    assert status == 200
+    assert body.startswith("validation-")
+    assert receiver.received == 0
+
+
+def test_notification_syncs_its_library(receiver):
+    status, _ = emulate_notification(receiver.url, "audio-drive", CLIENT_STATE)
+
+    assert status == 202
+    assert wait_for_runs(receiver.queue, "audio", 1) == 1
+    assert receiver.handlers.calls == {"documents": 0, "audio": 1}
+
+
+def test_wrong_client_state_is_rejected(receiver):
+    for client_state in ("wrong", ""):
+        status, _ = emulate_notification(receiver.url, "doc-drive", client_state)
+        assert status == 202
+
+    time.sleep(0.4)
+    assert receiver.rejected == 2
+    assert receiver.received == 0
+    assert receiver.handlers.calls == {"documents": 0, "audio": 0}
+
+
+def test_unknown_drive_is_ignored(receiver):
+    emulate_notification(receiver.url, "other-drive", CLIENT_STATE)
+
+    time.sleep(0.4)
+    assert receiver.received == 1
+    assert receiver.handlers.calls == {"documents": 0, "audio": 0}
+
+
+def test_invalid_json_is_a_bad_request(receiver):
+    import urllib.request
+
+    request = urllib.request.Request(receiver.url, data=b"{", method="POST")
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request)
+    assert error.value.code == 400
+
+
+def test_empty_client_state_is_refused():
+    queue = ChangeQueue({})
+    with pytest.raises(ValueError):
+        NotificationReceiver(queue, {}, "", host="127.0.0.1", port=0)
+
+
+def test_burst_is_debounced_into_one_sync(receiver):
+    for _ in range(5):
+        emulate_notification(receiver.url, "doc-drive", CLIENT_STATE)
+        time.sleep(0.05)
+
+    assert receiver.queue.wait_idle(timeout=5)
+    assert wait_for_runs(receiver.queue, "documents", 1) == 1
+    time.sleep(0.4)
+    assert receiver.handlers.calls["documents"] == 1
+    assert receiver.received == 5
+
+
+def test_max_delay_caps_the_debounce():
+    handlers = Handlers("documents")
+    queue = ChangeQueue(handlers.handlers(), debounce_seconds=0.3, max_delay_seconds=0.5)
+    started = time.monotonic()
+
+    # A signal every 0.1s would keep postponing the run forever.
+    while queue.runs["documents"] == 0 and time.monotonic() - started < 3:
+        queue.notify("documents")
+        time.sleep(0.1)
+
+    assert queue.runs["documents"] >= 1
+    assert time.monotonic() - started < 1.5
+
+
+def test_signals_during_a_run_queue_one_follow_up():
+    handlers = Handlers("documents", delay=0.3)
+    queue = ChangeQueue(handlers.handlers(), debounce_seconds=0.05, max_delay_seconds=1)
+
+    queue.notify("documents")
+    time.sleep(0.15)  # the first run is in progress
+    for _ in range(3):
+        queue.notify("documents")
+
+    assert wait_for_runs(queue, "documents", 2) == 2
+    time.sleep(0.4)
+    assert handlers.calls["documents"] == 2
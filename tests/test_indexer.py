@@ -0,0 +1,226 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import indexer
+from bulk_writer import BulkWriter
+
+
+# --- Fakes ---
+class FakeQuery:
+    """The slice of the supabase-py builder the indexer uses, over a list."""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.operation = None
+        self.rows = None
+        self.filters = []
+        self.window = None
+
+    def select(self, columns="*", count=None):
+        self.operation = "select"
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.operation, self.rows = "insert", rows
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, {str(value)}))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append((column, {str(v) for v in values}))
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end)
+        return self
+
+    @staticmethod
+    def value(row, column):
+        field, _, key = column.partition("->>")
+        value = row["metadata"].get(key) if key else row.get(field)
+        return None if value is None else str(value)
+
+    def matches(self, row):
+        return all(self.value(row, column) in allowed for column, allowed in self.filters)
+
+    def execute(self):
+        with self.db.lock:
+            rows = self.db.rows.setdefault(self.table, [])
+            if self.operation == "insert":
+                for row in self.rows:
+                    self.db.next_id += 1
+                    rows.append({"id": self.db.next_id, **row})
+                return SimpleNamespace(data=self.rows)
+            if self.operation == "delete":
+                self.db.rows[self.table] = [row for row in rows if not self.matches(row)]
+                return SimpleNamespace(data=[])
+            selected = [
+                {"id": row["id"], "chunk_hash": row["metadata"].get("chunk_hash")}
+                for row in rows
+                if self.matches(row)
+            ]
+            start, end = self.window or (0, len(selected))
+            return SimpleNamespace(data=selected[start : end + 1])
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.rows = {}
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def schema(self, name):
+        return SimpleNamespace(table=lambda table: FakeQuery(self, f"{name}.{table}"))
+
+
+class FakeChunker:
+    """A "document" is a list of (text, headings); each one is a chunk."""
+
+    def chunk(self, dl_doc):
+        return [
+            SimpleNamespace(text=text, meta=SimpleNamespace(headings=headings, doc_items=[]))
+            for text, headings in dl_doc
+        ]
+
+    def contextualize(self, chunk):
+        return chunk.text
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.embedded = []
+
+    def get_embeddings(self, texts):
+        self.embedded.extend(texts)
+        return [[0.5, 0.25] for _ in texts]
+
+
+@pytest.fixture
+def kb(tmp_path):
+    kb = indexer.KnowledgeBaseIndexer.__new__(indexer.KnowledgeBaseIndexer)
+    kb.root_dir = tmp_path
+    kb.db_schema, kb.db_table = "public", "documents"
+    kb.reindex_mode = "diff"
+    kb.supabase = FakeSupabase()
+    kb.writer = BulkWriter(kb.supabase, kb.db_schema, kb.db_table)
+    kb.embedder = FakeEmbedder()
+    kb.chunker = FakeChunker()
+    kb.manifest = SimpleNamespace(record=lambda path, content_hash: None)
+    kb.file_path = tmp_path / "Policies" / "leave.pdf"
+    return kb
+
+
+def index(kb, doc):
+    job = {"file_path": kb.file_path, "doc": doc, "content_hash": "hash"}
+    for step in (kb.chunk_document, kb.embed_chunks, kb.write_chunks):
+        job = step(job)
+    return job
+
+
+def stored(kb):
+    """{content: row id} of the file's rows (contents are unique here)."""
+    rows = kb.supabase.rows.get("public.documents", [])
+    return {row["content"]: row["id"] for row in rows}
+
+
+DOC = [("Leave policy", ["Leave"]), ("Ten days a year", ["Leave"]), ("Ask HR", ["Contact"])]
+
+
+# --- Chunk diff ---
+def test_first_index_inserts_every_chunk(kb):
+    result = index(kb, DOC)
+
+    assert result == {"file_path": kb.file_path, "inserted": 3, "removed": 0}
+    assert set(stored(kb)) == {"Leave policy", "Ten days a year", "Ask HR"}
+    row = kb.supabase.rows["public.documents"][0]
+    assert row["metadata"]["filepath"] == str(kb.file_path)
+    assert row["metadata"]["category"] == "Policies"
+    assert row["embedding"] == [0.5, 0.25]
+
+
+def test_reindexing_an_unchanged_file_writes_nothing(kb):
+    index(kb, DOC)
+    before = stored(kb)
+    kb.embedder.embedded.clear()
+
+    result = index(kb, DOC)
+
+    assert (result["inserted"], result["removed"]) == (0, 0)
+    assert stored(kb) == before
+    assert kb.embedder.embedded == []
+
+
+def test_edited_and_deleted_chunks_are_replaced(kb):
+    index(kb, DOC)
+    before = stored(kb)
+    kb.embedder.embedded.clear()
+
+    edited = [("Leave policy", ["Leave"]), ("Twelve days a year", ["Leave"])]
+    result = index(kb, edited)
+
+    assert (result["inserted"], result["removed"]) == (1, 2)
+    after = stored(kb)
+    assert set(after) == {"Leave policy", "Twelve days a year"}
+    # The unchanged chunk keeps its row; only the edit was embedded.
+    assert after["Leave policy"] == before["Leave policy"]
+    assert kb.embedder.embedded == ["Twelve days a year"]
+
+
+def test_metadata_change_counts_as_an_edit(kb):
+    index(kb, DOC)
+
+    moved = [("Leave policy", ["Leave"]), ("Ten days a year", ["Annual leave"]), DOC[2]]
+    result = index(kb, moved)
+
+    assert (result["inserted"], result["removed"]) == (1, 1)
+    assert len(kb.supabase.rows["public.documents"]) == 3
+
+
+def test_repeated_chunks_keep_one_row_each(kb):
+    doc = [("Signature", []), ("Signature", []), ("Body", [])]
+    index(kb, doc)
+
+    result = index(kb, doc[1:])
+
+    assert (result["inserted"], result["removed"]) == (0, 1)
+    contents = sorted(row["content"] for row in kb.supabase.rows["public.documents"])
+    assert contents == ["Body", "Signature"]
+
+
+def test_other_files_are_left_alone(kb):
+    index(kb, DOC)
+    kb.file_path = kb.root_dir / "other.pdf"
+
+    index(kb, [("Ask HR", ["Contact"])])
+    index(kb, [])
+
+    assert len(kb.supabase.rows["public.documents"]) == 3
+
+
+def test_replace_mode_rewrites_every_chunk(kb):
+    index(kb, DOC)
+    kb.reindex_mode = "replace"
+
+    result = index(kb, DOC)
+
+    assert (result["inserted"], result["removed"]) == (3, 0)
+    assert len(kb.supabase.rows["public.documents"]) == 3
+    assert min(stored(kb).values()) > 3
+
+
+def test_file_without_text_drops_its_rows(kb):
+    index(kb, DOC)
+
+    result = index(kb, [("   ", [])])
+
+    assert (result["inserted"], result["removed"]) == (0, 3)
+    assert kb.supabase.rows["public.documents"] == []
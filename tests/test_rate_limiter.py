@@ -0,0 +1,197 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import (
+    RateLimitedScheduler,
+    RequestDroppedError,
+    RetryableError,
+    TokenBucket,
+    parse_duration,
+)
+
+
+class FakeClock:
+    """Stands in for the `time` module: sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+        self.on_sleep = None
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if self.on_sleep:
+            self.on_sleep(seconds)
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    # Backoff without jitter.
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: high)
+    return clock
+
+
+def failing(times, **retry):
+    """A call that raises RetryableError `times` times, then returns "ok"."""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= times:
+            raise RetryableError(Exception("busy"), **retry)
+        return "ok"
+
+    func.calls = calls
+    return func
+
+
+# --- RateLimitedScheduler ---
+def test_slot_is_released_while_backing_off(clock):
+    scheduler = RateLimitedScheduler(600, 100000, max_concurrency=1)
+    in_flight = []
+    clock.on_sleep = lambda seconds: in_flight.append(scheduler.metrics()["in_flight"])
+
+    assert scheduler.run(failing(2)) == "ok"
+
+    assert in_flight == [0, 0]
+    assert scheduler.metrics()["in_flight"] == 0
+
+
+def test_backoff_is_exponential_and_honours_retry_after(clock):
+    scheduler = RateLimitedScheduler(600, 100000, max_backoff=3)
+
+    scheduler.run(failing(3))
+    assert clock.sleeps == [1, 2, 3]
+
+    clock.sleeps.clear()
+    scheduler.run(failing(1, retry_after=7.5))
+    assert clock.sleeps == [7.5]
+
+
+def test_dropped_after_max_retries(clock):
+    scheduler = RateLimitedScheduler(600, 100000, max_retries=2)
+    func = failing(10)
+
+    with pytest.raises(RequestDroppedError, match="after 3 attempts"):
+        scheduler.run(func)
+
+    assert len(func.calls) == 3
+    metrics = scheduler.metrics()
+    assert metrics["retries"] == 2
+    assert metrics["dropped"] == 1
+    assert metrics["completed"] == 0
+    assert metrics["in_flight"] == 0
+
+
+def test_other_errors_are_dropped_without_retry(clock):
+    scheduler = RateLimitedScheduler(600, 100000)
+
+    def broken():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.run(broken)
+
+    metrics = scheduler.metrics()
+    assert (metrics["dropped"], metrics["retries"], metrics["in_flight"]) == (1, 0, 0)
+    assert clock.sleeps == []
+
+
+def test_throttling_halves_concurrency_and_successes_grow_it_back(clock):
+    scheduler = RateLimitedScheduler(6000, 1000000, max_concurrency=8)
+
+    scheduler.run(failing(2, rate_limited=True))
+    metrics = scheduler.metrics()
+    assert metrics["throttled"] == 2
+    assert metrics["concurrency_limit"] == 2
+
+    # One step up after 2 * limit successes in a row (the call above
+    # already counted as one).
+    for _ in range(3):
+        scheduler.run(lambda: "ok")
+    assert scheduler.metrics()["concurrency_limit"] == 3
+    assert scheduler.metrics()["completed"] == 4
+
+
+def test_calls_wait_for_the_request_bucket(clock):
+    scheduler = RateLimitedScheduler(60, 100000)
+    scheduler.requests.available = 0
+
+    scheduler.run(lambda: "ok")
+
+    # 60 requests per minute: one more is available after a second.
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_observe_headers_adopts_limits_and_drains_on_reset(clock):
+    scheduler = RateLimitedScheduler(600, 100000)
+
+    scheduler.observe_headers(
+        {
+            "x-ratelimit-limit-requests": "120",
+            "x-ratelimit-limit-tokens": "50000",
+            "x-ratelimit-remaining-requests": "1",
+            "x-ratelimit-reset-requests": "2s",
+        }
+    )
+
+    metrics = scheduler.metrics()
+    assert metrics["requests_per_minute"] == 120
+    assert metrics["tokens_per_minute"] == 50000
+
+    scheduler.run(lambda: "ok")
+    # Drained for 2s, then one request needs another half second.
+    assert sum(clock.sleeps) == pytest.approx(2.5)
+
+
+def test_observe_headers_ignores_missing_values(clock):
+    scheduler = RateLimitedScheduler(600, 100000)
+
+    scheduler.observe_headers({})
+
+    assert scheduler.metrics()["requests_per_minute"] == 600
+    assert scheduler.requests.available == 600
+
+
+# --- TokenBucket ---
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(120)
+    bucket.acquire(120)
+
+    clock.now += 30
+    bucket.acquire(60)
+    assert clock.sleeps == []
+
+    bucket.acquire(30)
+    assert clock.sleeps == [pytest.approx(15.0)]
+
+
+def test_token_bucket_caps_oversized_requests(clock):
+    bucket = TokenBucket(10)
+
+    bucket.acquire(1000)
+
+    assert bucket.available == 0
+    assert clock.sleeps == []
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [
+        ("1s", 1),
+        ("6m0s", 360),
+        ("20ms", 0.02),
+        ("2.5", 2.5),
+        ("1h2m", 3720),
+        (None, None),
+        ("soon", None),
+    ],
+)
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds else seconds)
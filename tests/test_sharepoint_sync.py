@@ -0,0 +1,339 @@
+from concurrent.futures import Future
+
+import pytest
+
+from sharepoint_sync import DriveSync
+
+
+# --- Fakes ---
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.headers = {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}")
+
+
+class FakeGraph:
+    """Serves queued delta pages in order, recording the requested URLs.
+
+    A page with `more` links to the next page instead of ending the walk
+    with a delta link; `status` fails the request instead.
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.requests = []
+
+    def add_page(self, *items, more=False, status=200):
+        self.pages.append((list(items), more, status))
+
+    def resolve_drive(self, site_ref, drive_name):
+        return "site", "drive"
+
+    def auth_headers(self, force_refresh=False):
+        return {"Authorization": "Bearer test"}
+
+    def get(self, url, **kwargs):
+        self.requests.append(url)
+        items, more, status = self.pages.pop(0)
+        n = len(self.requests)
+        link = {"@odata.nextLink": f"page-{n}"} if more else {"@odata.deltaLink": f"delta-{n}"}
+        return FakeResponse(status, {"value": items, **link})
+
+
+class FakeDownloader:
+    """Writes `contents[url]` to the target path instead of fetching it."""
+
+    def __init__(self):
+        self.contents = {}
+        self.downloads = []
+
+    def submit(self, source, path, headers=None):
+        url, _ = source(False)
+        self.downloads.append(path)
+        future = Future()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.contents[url])
+        future.set_result(path)
+        return future
+
+
+def root():
+    return {"id": "root", "name": "root", "root": {}, "folder": {}}
+
+
+def folder(item_id, name, parent="root"):
+    return {"id": item_id, "name": name, "folder": {}, "parentReference": {"id": parent}}
+
+
+def file(item_id, name, parent="root", modified="2024-01-01T00:00:00Z"):
+    return {
+        "id": item_id,
+        "name": name,
+        "file": {},
+        "parentReference": {"id": parent},
+        "lastModifiedDateTime": modified,
+        "@microsoft.graph.downloadUrl": f"mem://{item_id}/{modified}",
+    }
+
+
+@pytest.fixture
+def drive(tmp_path):
+    graph = FakeGraph()
+    downloader = FakeDownloader()
+
+    syncs = []
+
+    def run(index=True, sync_class=DriveSync, **kwargs):
+        sync = sync_class(
+            tmp_path / "dl", tmp_path / "state.sqlite3", "delta", graph=graph, **kwargs
+        )
+        sync.downloader = downloader
+        syncs.append(sync)
+        yielded = list(sync.iter_sync())
+        if index:
+            sync.mark_indexed(yielded)
+        return sync, yielded
+
+    graph.run = run
+    graph.downloader = downloader
+    graph.dl = tmp_path / "dl"
+    yield graph
+    for sync in syncs:
+        sync.store.conn.close()
+
+
+def publish(drive, item, content):
+    drive.downloader.contents[item["@microsoft.graph.downloadUrl"]] = content
+    return item
+
+
+# --- iter_sync ---
+def test_folder_rename_with_edited_file_is_yielded_once(drive):
+    drive.add_page(root(), folder("fA", "A"), publish(drive, file("w", "w.pdf", "fA"), "v1"))
+    drive.run()
+
+    edited = file("w", "w.pdf", "fA", modified="2024-02-01T00:00:00Z")
+    drive.add_page(folder("fA", "C"), publish(drive, edited, "v2"))
+    sync, yielded = drive.run()
+
+    assert yielded == [drive.dl / "C" / "w.pdf"]
+    assert (drive.dl / "C" / "w.pdf").read_text() == "v2"
+    assert drive.dl / "A" / "w.pdf" in sync.deleted_files
+
+
+def test_folder_rename_yields_moved_files(drive):
+    drive.add_page(root(), folder("fA", "A"), publish(drive, file("w", "w.pdf", "fA"), "v1"))
+    drive.run()
+
+    drive.add_page(folder("fA", "C"))
+    _, yielded = drive.run()
+
+    assert yielded == [drive.dl / "C" / "w.pdf"]
+    assert len(drive.downloader.downloads) == 1
+
+
+def test_unindexed_file_downloaded_again_is_yielded_once(drive):
+    drive.add_page(root(), publish(drive, file("w", "w.pdf"), "v1"))
+    drive.run(index=False)
+
+    edited = file("w", "w.pdf", modified="2024-02-01T00:00:00Z")
+    drive.add_page(publish(drive, edited, "v2"))
+    _, yielded = drive.run()
+
+    assert yielded == [drive.dl / "w.pdf"]
+    assert (drive.dl / "w.pdf").read_text() == "v2"
+
+
+def test_unindexed_file_is_yielded_again(drive):
+    drive.add_page(root(), publish(drive, file("w", "w.pdf"), "v1"))
+    drive.run(index=False)
+
+    drive.add_page()
+    _, yielded = drive.run()
+
+    assert yielded == [drive.dl / "w.pdf"]
+    assert len(drive.downloader.downloads) == 1
+
+
+# --- Delta mode ---
+class PdfSync(DriveSync):
+    def should_sync(self, name):
+        return name.endswith(".pdf")
+
+
+def deleted(item_id):
+    return {"id": item_id, "deleted": {"state": "deleted"}}
+
+
+def files_in(drive):
+    return sorted(p.relative_to(drive.dl).as_posix() for p in drive.dl.rglob("*") if p.is_file())
+
+
+def test_first_run_downloads_the_tree_and_saves_the_delta_link(drive):
+    drive.add_page(
+        root(),
+        folder("fA", "A"),
+        folder("fB", "B", "fA"),
+        publish(drive, file("a", "a.pdf", "fA"), "a"),
+        publish(drive, file("b", "b.pdf", "fB"), "b"),
+    )
+    sync, yielded = drive.run()
+
+    assert sorted(yielded) == [drive.dl / "A" / "B" / "b.pdf", drive.dl / "A" / "a.pdf"]
+    assert files_in(drive) == ["A/B/b.pdf", "A/a.pdf"]
+    assert drive.requests == ["https://graph.microsoft.com/v1.0/sites/site/drives/drive/root/delta"]
+
+    drive.add_page()
+    _, yielded = drive.run()
+    assert drive.requests[-1] == "delta-1"
+    assert yielded == []
+
+
+def test_renamed_file_is_moved_without_downloading(drive):
+    drive.add_page(root(), folder("fA", "A"), publish(drive, file("a", "a.pdf", "fA"), "a"))
+    drive.run()
+
+    drive.add_page(file("a", "renamed.pdf", "fA"))
+    sync, yielded = drive.run()
+
+    assert yielded == [drive.dl / "A" / "renamed.pdf"]
+    assert sync.deleted_files == [drive.dl / "A" / "a.pdf"]
+    assert files_in(drive) == ["A/renamed.pdf"]
+    assert len(drive.downloader.downloads) == 1
+
+
+def test_deleted_file_is_removed(drive):
+    drive.add_page(
+        root(), publish(drive, file("a", "a.pdf"), "a"), publish(drive, file("b", "b.pdf"), "b")
+    )
+    drive.run()
+
+    drive.add_page(deleted("a"))
+    sync, yielded = drive.run()
+
+    assert yielded == []
+    assert sync.deleted_files == [drive.dl / "a.pdf"]
+    assert files_in(drive) == ["b.pdf"]
+    assert sync.store.path_of("a") is None
+
+
+def test_deleted_folder_removes_everything_below_it(drive):
+    drive.add_page(
+        root(),
+        folder("fA", "A"),
+        folder("fB", "B", "fA"),
+        publish(drive, file("a", "a.pdf", "fA"), "a"),
+        publish(drive, file("b", "b.pdf", "fB"), "b"),
+        publish(drive, file("c", "c.pdf"), "c"),
+    )
+    drive.run()
+
+    drive.add_page(deleted("fA"))
+    sync, _ = drive.run()
+
+    assert sorted(sync.deleted_files) == [drive.dl / "A" / "B" / "b.pdf", drive.dl / "A" / "a.pdf"]
+    assert files_in(drive) == ["c.pdf"]
+    assert sync.store.item_ids("folder") == ["root"]
+
+
+def test_folder_moved_into_another_folder(drive):
+    drive.add_page(
+        root(),
+        folder("fA", "A"),
+        folder("fB", "B", "fA"),
+        folder("fX", "X"),
+        publish(drive, file("b", "b.pdf", "fB"), "b"),
+    )
+    drive.run()
+
+    drive.add_page(folder("fA", "A", "fX"))
+    sync, yielded = drive.run()
+
+    assert yielded == [drive.dl / "X" / "A" / "B" / "b.pdf"]
+    assert sync.deleted_files == [drive.dl / "A" / "B" / "b.pdf"]
+    assert files_in(drive) == ["X/A/B/b.pdf"]
+    assert sync.store.path_of("fB") == "X/A/B"
+
+    # Later changes below the moved folder land under its new path.
+    drive.add_page(publish(drive, file("n", "n.pdf", "fB"), "n"))
+    _, yielded = drive.run()
+    assert yielded == [drive.dl / "X" / "A" / "B" / "n.pdf"]
+
+
+def test_file_renamed_to_an_unsynced_name_is_removed(drive):
+    drive.add_page(root(), publish(drive, file("a", "a.pdf"), "a"))
+    drive.run(sync_class=PdfSync)
+
+    drive.add_page(file("a", "a.tmp"))
+    sync, yielded = drive.run(sync_class=PdfSync)
+
+    assert yielded == []
+    assert sync.deleted_files == [drive.dl / "a.pdf"]
+    assert files_in(drive) == []
+
+
+def test_item_with_an_unknown_parent_is_skipped(drive):
+    drive.add_page(root(), publish(drive, file("a", "a.pdf", "nowhere"), "a"))
+    sync, yielded = drive.run()
+
+    assert yielded == []
+    assert sync.store.path_of("a") is None
+
+
+def test_interrupted_walk_resumes_from_its_cursor(drive):
+    drive.add_page(root(), publish(drive, file("a", "a.pdf"), "a"), more=True)
+    drive.add_page(status=500)
+    with pytest.raises(Exception, match="HTTP 500"):
+        drive.run()
+
+    # The failed run never recorded a's download as done, so it is fetched
+    # again through /content.
+    content_url = "https://graph.microsoft.com/v1.0/sites/site/drives/drive/items/a/content"
+    drive.downloader.contents[content_url] = "a"
+    drive.add_page(publish(drive, file("b", "b.pdf"), "b"))
+    _, yielded = drive.run()
+
+    assert drive.requests[-1] == "page-1"
+    assert sorted(yielded) == [drive.dl / "a.pdf", drive.dl / "b.pdf"]
+    assert len(drive.downloader.downloads) == 3
+
+
+def test_expired_delta_link_resyncs_and_drops_unseen_items(drive):
+    drive.add_page(
+        root(), publish(drive, file("a", "a.pdf"), "a"), publish(drive, file("b", "b.pdf"), "b")
+    )
+    drive.run()
+
+    drive.add_page(status=410)
+    drive.add_page(root(), file("a", "a.pdf"))
+    sync, yielded = drive.run()
+
+    assert drive.requests[-2:] == [
+        "delta-1",
+        "https://graph.microsoft.com/v1.0/sites/site/drives/drive/root/delta",
+    ]
+    assert yielded == []
+    assert sync.deleted_files == [drive.dl / "b.pdf"]
+    assert files_in(drive) == ["a.pdf"]
+
+
+def test_migrated_state_gets_paths_without_downloading(drive, tmp_path):
+    (drive.dl).mkdir()
+    (drive.dl / "a.pdf").write_text("a")
+    state = tmp_path / "sync_state.json"
+    state.write_text('{"a": "2024-01-01T00:00:00Z"}')
+
+    drive.add_page(root(), file("a", "a.pdf"))
+    sync, yielded = drive.run(legacy_state=(state,))
+
+    assert yielded == []
+    assert drive.downloader.downloads == []
+    assert sync.store.file_paths() == ["a.pdf"]
@@ -0,0 +1,135 @@
+import json
+
+import pytest
+
+from sync_store import SyncStore, parse_timestamp
+
+MODIFIED = "2024-01-01T00:00:00Z"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SyncStore(tmp_path / "state.sqlite3")
+    yield store
+    store.conn.close()
+
+
+def test_download_lifecycle(store):
+    store.start_download("f1", "A/a.pdf", MODIFIED)
+    assert store.get("f1") == ("file", "A/a.pdf", parse_timestamp(MODIFIED), None)
+    assert store.incomplete_downloads() == [("f1", "A/a.pdf")]
+    assert store.pending_index() == []
+
+    store.mark_downloaded("f1")
+    assert store.incomplete_downloads() == []
+    assert store.pending_index() == ["A/a.pdf"]
+
+    store.mark_indexed(["A/a.pdf"])
+    assert store.pending_index() == []
+
+    # A new version starts over.
+    store.start_download("f1", "A/a.pdf", "2024-02-01T00:00:00Z")
+    assert store.incomplete_downloads() == [("f1", "A/a.pdf")]
+
+
+def test_paths_by_kind(store):
+    store.set_path("d1", "folder", "A")
+    store.start_download("f1", "A/a.pdf", MODIFIED)
+
+    assert store.path_of("d1") == "A"
+    assert store.path_of("d1", "file") is None
+    assert store.path_of("f1", "file") == "A/a.pdf"
+    assert store.path_of("missing") is None
+    assert store.item_ids("folder") == ["d1"]
+    assert store.file_paths() == ["A/a.pdf"]
+
+
+def test_move_prefix_only_rewrites_items_below_the_folder(store):
+    store.set_path("d1", "folder", "A")
+    store.set_path("d2", "folder", "A/B")
+    store.start_download("f1", "A/B/a.pdf", MODIFIED)
+    store.start_download("f2", "AB/b.pdf", MODIFIED)
+    store.start_download("f3", "A.pdf", MODIFIED)
+
+    assert sorted(store.under("A", "file")) == [("f1", "A/B/a.pdf")]
+    store.move_prefix("A", "C/A")
+
+    assert store.path_of("d1") == "A"  # the folder row itself is set by the caller
+    assert store.path_of("d2") == "C/A/B"
+    assert store.path_of("f1") == "C/A/B/a.pdf"
+    assert store.path_of("f2") == "AB/b.pdf"
+    assert store.path_of("f3") == "A.pdf"
+
+
+def test_forget_and_is_empty(store):
+    assert store.is_empty()
+    store.set_path("d1", "folder", "A")
+    assert not store.is_empty()
+
+    store.forget("d1")
+    assert store.is_empty()
+
+
+def test_values(store):
+    assert store.get_value("delta_link") is None
+    store.set_value("delta_link", "https://next")
+    store.set_value("delta_link", "https://later")
+    assert store.get_value("delta_link") == "https://later"
+
+    store.set_value("delta_link", None)
+    assert store.get_value("delta_link") is None
+
+
+def test_state_survives_reopening(tmp_path):
+    store = SyncStore(tmp_path / "state.sqlite3")
+    store.start_download("f1", "a.pdf", MODIFIED)
+    store.mark_downloaded("f1")
+    store.set_value("delta_link", "https://next")
+    store.conn.close()
+
+    store = SyncStore(tmp_path / "state.sqlite3")
+    assert store.pending_index() == ["a.pdf"]
+    assert store.get_value("delta_link") == "https://next"
+    store.conn.close()
+
+
+# --- Migration ---
+def test_import_json_state_and_delta(store, tmp_path):
+    state = tmp_path / "sync_state.json"
+    delta = tmp_path / "sync_delta.json"
+    state.write_text(json.dumps({"f1": MODIFIED, "f2": MODIFIED}))
+    delta.write_text(
+        json.dumps(
+            {
+                "files": {"f1": "A/a.pdf"},
+                "folders": {"root": "", "d1": "A"},
+                "delta_link": "https://delta",
+            }
+        )
+    )
+
+    assert store.import_json(state, delta) == 2
+
+    # Migrated files count as indexed; f2 has no path until the next sync.
+    kind, path, modified, downloaded_at = store.get("f1")
+    assert (kind, path, modified) == ("file", "A/a.pdf", parse_timestamp(MODIFIED))
+    assert downloaded_at is not None
+    assert store.path_of("f2", "file") == ""
+    assert store.pending_index() == []
+    assert store.incomplete_downloads() == []
+    assert store.path_of("d1", "folder") == "A"
+    assert store.get_value("delta_link") == "https://delta"
+
+
+def test_import_json_state_only(store, tmp_path):
+    state = tmp_path / "sync_state.json"
+    state.write_text(json.dumps({"f1": MODIFIED}))
+
+    assert store.import_json(state, tmp_path / "missing.json") == 1
+    assert sorted(store.file_paths()) == [""]
+    assert store.get_value("delta_link") is None
+
+
+def test_import_json_without_files_imports_nothing(store, tmp_path):
+    assert store.import_json(tmp_path / "missing.json") == 0
+    assert store.is_empty()
@@ -0,0 +1,23 @@
+import pytest
+
+from text_loaders import HEADING_PATTERN
+
+
+@pytest.mark.parametrize(
+    "line, level, title",
+    [
+        ("# Leave policy", "#", "Leave policy"),
+        ("### Contacts  ", "###", "Contacts"),
+        ("## Closed ##", "##", "Closed"),
+        ("# C#", "#", "C#"),
+        ("## F# and C# ##", "##", "F# and C#"),
+        ("# #", "#", "#"),
+    ],
+)
+def test_heading_pattern(line, level, title):
+    assert HEADING_PATTERN.match(line).groups() == (level, title)
+
+
+@pytest.mark.parametrize("line", ["#hashtag", "####### seven", "text # not a heading"])
+def test_heading_pattern_rejects_non_headings(line):
+    assert HEADING_PATTERN.match(line) is None
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+import soundfile
+
+from transcription import shift_segments, split_windows, stitch_windows
+
+RATE = 1000
+
+
+def write_call(path, seconds):
+    soundfile.write(str(path), np.zeros(int(seconds * RATE), "int16"), RATE, subtype="PCM_16")
+    return path
+
+
+def windows_of(path, window_seconds=10, overlap_seconds=2):
+    """[(offset, seconds, temporary)] of each window, deleting the temp files."""
+    windows = []
+    for offset, window_path, temporary in split_windows(path, window_seconds, overlap_seconds):
+        windows.append((offset, soundfile.info(str(window_path)).frames / RATE, temporary))
+        if temporary:
+            window_path.unlink()
+    return windows
+
+
+def segment(text, start, end):
+    return {"text": text, "start": start, "end": end}
+
+
+def fake_transcribe(offset, seconds):
+    """One "word" per whole second of the window, on the call's timeline."""
+    segments = [segment(f"w{offset + t:g}", t, t + 1) for t in range(int(seconds))]
+    return shift_segments(segments, offset)
+
+
+# --- split_windows ---
+@pytest.mark.parametrize("seconds", [5, 12])
+def test_call_that_fits_is_a_single_window(tmp_path, seconds):
+    path = write_call(tmp_path / "call.wav", seconds)
+
+    assert list(split_windows(path, 10, 2)) == [(0.0, path, False)]
+
+
+def test_windows_step_by_window_and_share_the_overlap(tmp_path):
+    path = write_call(tmp_path / "call.wav", 25)
+
+    assert windows_of(path) == [(0.0, 12.0, True), (10.0, 12.0, True), (20.0, 5.0, True)]
+
+
+@pytest.mark.parametrize("seconds", [12.001, 20.5, 21, 22, 22.5])
+def test_last_window_is_never_shorter_than_the_overlap(tmp_path, seconds):
+    path = write_call(tmp_path / "call.wav", seconds)
+
+    windows = windows_of(path)
+
+    # A tail shorter than the overlap is already inside the previous window.
+    assert windows[-1][1] > 2
+    offset, length, _ = windows[-1]
+    assert offset + length == pytest.approx(seconds)
+
+
+def test_unreadable_file_is_a_single_window(tmp_path):
+    path = tmp_path / "call.mp3"
+    path.write_bytes(b"not audio")
+
+    assert list(split_windows(path, 10, 2)) == [(0.0, path, False)]
+
+
+# --- shift_segments ---
+def test_shift_segments_keeps_missing_timings():
+    segments = shift_segments([segment("a", 1.234, 2.5), segment("b", None, None)], 10)
+
+    assert segments == [segment("a", 11.23, 12.5), segment("b", None, None)]
+
+
+# --- stitch_windows ---
+def test_single_window_is_kept_whole():
+    segments = [segment("a", 0, 4), segment("b", 4, 11.9), segment("c", None, None)]
+
+    assert stitch_windows([(0.0, segments)], 2) == segments
+
+
+def test_segment_straddling_the_overlap_is_kept_once():
+    # Windows [0, 12) and [10, 22): the overlap is cut at 11.
+    first = [segment("a", 8, 10.4), segment("straddle", 10.5, 11.8)]
+    second = [segment("straddle", 10.6, 11.7), segment("b", 11.7, 14)]
+
+    stitched = stitch_windows([(0.0, first), (10.0, second)], 2)
+
+    assert [s["text"] for s in stitched] == ["a", "straddle", "b"]
+    # Its midpoint (11.15) lies past the cut, so the second window's copy wins.
+    assert stitched[1]["start"] == 10.6
+
+
+def test_segment_centred_on_the_cut_goes_to_the_later_window():
+    first = [segment("edge", 10, 12)]
+    second = [segment("edge", 10.5, 11.5)]
+
+    stitched = stitch_windows([(0.0, first), (10.0, second)], 2)
+
+    assert stitched == [segment("edge", 10.5, 11.5)]
+
+
+def test_untimed_segments_are_deduplicated_by_text():
+    first = [segment("hello", None, None)]
+    second = [segment("hello", None, None), segment("bye", None, None)]
+
+    stitched = stitch_windows([(0.0, first), (10.0, second)], 2)
+
+    assert [s["text"] for s in stitched] == ["hello", "bye"]
+
+
+@pytest.mark.parametrize("seconds", [12, 21, 25, 41.5])
+def test_split_and_stitch_keep_every_word_once(tmp_path, seconds):
+    path = write_call(tmp_path / "call.wav", seconds)
+    windows = [
+        (offset, fake_transcribe(offset, length)) for offset, length, _ in windows_of(path)
+    ]
+
+    stitched = stitch_windows(windows, 2)
+
+    assert [s["text"] for s in stitched] == [f"w{t}" for t in range(int(seconds))]